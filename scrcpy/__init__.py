@@ -2,5 +2,9 @@
 Python Scrcpy Client's core module
 """
 
+from .aio import AsyncClient
 from .const import *
 from .core import Client
+from .frame import Frame, FramePool
+from .hub import DeviceHub
+from .template import TemplateMatcher, TemplateRegistry
@@ -0,0 +1,345 @@
+"""
+Asyncio client, one event loop can drive many devices without a thread per device
+"""
+
+import asyncio
+import functools
+import struct
+from collections import deque
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, Deque, List, Optional, Tuple
+
+import numpy as np
+
+from . import const
+from .control import ControlSender
+from .core import Client
+from .device_message import DeviceMessageParser
+
+
+def packed(f):
+    """
+    Send the message packed by the ControlSender method of the same name
+
+    Args:
+        f: async method with the same signature as the ControlSender one
+    """
+
+    @functools.wraps(f)
+    async def inner(self, *args, **kwargs):
+        package = getattr(self.packer, f.__name__)(*args, **kwargs)
+        await self.send(package)
+        return package
+
+    return inner
+
+
+class AsyncControlSender:
+    def __init__(self, parent: "AsyncClient"):
+        """
+        Awaitable version of ControlSender, messages are written to an asyncio stream
+
+        Args:
+            parent: owner client
+        """
+        self.parent = parent
+        # ControlSender only packs messages while control_socket is None
+        self.control_socket = None
+        self.packer = ControlSender(self)
+
+        self.__reader: Optional[asyncio.StreamReader] = None
+        self.__writer: Optional[asyncio.StreamWriter] = None
+        self.__write_lock: Optional[asyncio.Lock] = None
+        self.__clipboard_waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def resolution(self) -> Optional[Tuple[int, int]]:
+        return self.parent.resolution
+
+    def attach(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Use the streams of a connected control socket
+
+        Args:
+            reader: control socket reader
+            writer: control socket writer
+        """
+        self.__reader = reader
+        self.__writer = writer
+        # Created here, asyncio primitives bind to the running loop on old Pythons
+        self.__write_lock = asyncio.Lock()
+
+    async def send(self, package: bytes) -> None:
+        """
+        Write a packed message, wait until it is flushed to the socket
+
+        Args:
+            package: message packed by ControlSender
+        """
+        async with self.__write_lock:
+            self.__writer.write(package)
+            await self.__writer.drain()
+
+    async def receive_loop(self) -> None:
+        """
+        Read device messages, clipboard messages resolve pending get_clipboard calls
+
+        Raises:
+            ConnectionError: control socket closed, or unknown message type
+        """
+        # Framed like DeviceMessageReader does for Client
+        parser = DeviceMessageParser()
+        while True:
+            data = await self.__reader.read(0x10000)
+            if not data:
+                raise ConnectionError("Control socket closed")
+            for message_type, payload in parser.feed(data):
+                if message_type != const.DEVICE_MSG_TYPE_CLIPBOARD:
+                    continue
+                if self.__clipboard_waiters:
+                    waiter = self.__clipboard_waiters.popleft()
+                    if not waiter.done():
+                        waiter.set_result(payload)
+
+    def cancel(self, e: BaseException) -> None:
+        """
+        Fail pending get_clipboard calls
+
+        Args:
+            e: exception to raise in the callers
+        """
+        while self.__clipboard_waiters:
+            waiter = self.__clipboard_waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(e)
+
+    async def get_clipboard(self) -> str:
+        """
+        Get clipboard, the reply is read by receive_loop
+        """
+        waiter = asyncio.get_event_loop().create_future()
+        self.__clipboard_waiters.append(waiter)
+        await self.send(struct.pack(">B", const.TYPE_GET_CLIPBOARD))
+        return await waiter
+
+    @packed
+    async def keycode(
+        self, keycode: int, action: int = const.ACTION_DOWN, repeat: int = 0
+    ) -> bytes:
+        """
+        Send keycode to device, see ControlSender.keycode
+        """
+
+    @packed
+    async def text(self, text: str) -> bytes:
+        """
+        Send text to device, see ControlSender.text
+        """
+
+    @packed
+    async def touch(
+        self, x: int, y: int, action: int = const.ACTION_DOWN, touch_id: int = -1
+    ) -> bytes:
+        """
+        Touch screen, see ControlSender.touch
+        """
+
+    @packed
+    async def touch_many(self, events: np.ndarray) -> bytes:
+        """
+        Send many touch events in one write, see ControlSender.touch_many
+        """
+
+    @packed
+    async def scroll(self, x: int, y: int, h: int, v: int) -> bytes:
+        """
+        Scroll screen, see ControlSender.scroll
+        """
+
+    @packed
+    async def back_or_turn_screen_on(self, action: int = const.ACTION_DOWN) -> bytes:
+        """
+        If the screen is off, it is turned on only on ACTION_DOWN
+        """
+
+    @packed
+    async def expand_notification_panel(self) -> bytes:
+        """
+        Expand notification panel
+        """
+
+    @packed
+    async def expand_settings_panel(self) -> bytes:
+        """
+        Expand settings panel
+        """
+
+    @packed
+    async def collapse_panels(self) -> bytes:
+        """
+        Collapse all panels
+        """
+
+    @packed
+    async def set_clipboard(self, text: str, paste: bool = False) -> bytes:
+        """
+        Set clipboard, see ControlSender.set_clipboard
+        """
+
+    @packed
+    async def set_screen_power_mode(self, mode: int = const.POWER_MODE_NORMAL) -> bytes:
+        """
+        Set screen power mode, see ControlSender.set_screen_power_mode
+        """
+
+    @packed
+    async def rotate_device(self) -> bytes:
+        """
+        Rotate device
+        """
+
+
+class AsyncClient:
+    def __init__(
+        self,
+        device: Any = None,
+        executor: Optional[Executor] = None,
+        **kwargs,
+    ):
+        """
+        Create an asyncio scrcpy client, nothing happens until start is awaited.
+        Sockets are served by the event loop, decoding runs on the executor.
+
+        Args:
+            device: Android device, see Client
+            executor: executor running connection and decoding, None uses the loop's default executor.
+                Share one sized executor between many clients
+            kwargs: other Client options, pipelined and decode_process are not supported
+        """
+        assert not kwargs.get("pipelined"), "AsyncClient can't be pipelined"
+        assert not kwargs.get("decode_process"), "AsyncClient can't use decode_process"
+
+        # The control socket is read by the event loop
+        self.client = Client(device=device, read_device_messages=False, **kwargs)
+        self.executor = executor
+        self.control = AsyncControlSender(self)
+        self.alive = False
+
+        self.__tasks: List[asyncio.Task] = []
+        self.__writers: List[asyncio.StreamWriter] = []
+        self.__frame_cond: Optional[asyncio.Condition] = None
+
+    @property
+    def resolution(self) -> Optional[Tuple[int, int]]:
+        return self.client.resolution
+
+    @property
+    def device_name(self) -> Optional[str]:
+        return self.client.device_name
+
+    @property
+    def last_frame(self) -> Optional[np.ndarray]:
+        """
+        Latest frame, see Client.last_frame
+        """
+        return self.client.last_frame
+
+    def add_listener(self, cls: str, listener: Any) -> None:
+        """
+        Add a Client listener, frame listeners are called from the executor
+
+        Args:
+            cls: Listener category, support: init, frame
+            listener: listener function
+        """
+        self.client.add_listener(cls, listener)
+
+    async def start(self) -> None:
+        """
+        Deploy the server, connect and start reading the sockets
+        """
+        assert self.alive is False
+
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.executor, self.client.connect)
+        self.alive = True
+        self.__frame_cond = asyncio.Condition()
+
+        video_reader, video_writer = await asyncio.open_connection(
+            sock=self.client.video_socket
+        )
+        control_reader, control_writer = await asyncio.open_connection(
+            sock=self.client.control_socket
+        )
+        self.__writers = [video_writer, control_writer]
+        self.control.attach(control_reader, control_writer)
+        self.__tasks = [
+            loop.create_task(self.__stream_loop(video_reader)),
+            loop.create_task(self.__control_loop()),
+        ]
+
+    async def stop(self) -> None:
+        """
+        Stop reading, close the sockets, end the frames iterators
+        """
+        if not self.alive:
+            return
+        self.alive = False
+        for task in self.__tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+        for writer in self.__writers:
+            writer.close()
+        self.control.cancel(ConnectionError("Client stopped"))
+        self.client.stop()
+        async with self.__frame_cond:
+            self.__frame_cond.notify_all()
+
+    async def frames(self) -> AsyncIterator[Any]:
+        """
+        Iterate over decoded frames until the client stops. Only the latest frame is kept,
+        a slow consumer skips the frames decoded meanwhile instead of queueing them
+        """
+        loop = asyncio.get_event_loop()
+        seq = 0
+        while True:
+            async with self.__frame_cond:
+                await self.__frame_cond.wait_for(
+                    lambda: not self.alive or self.client.frame_slot.seq > seq
+                )
+            if not self.alive:
+                return
+            # Conversion may be heavy, keep it off the event loop
+            seq, frame = await loop.run_in_executor(
+                self.executor, self.client.frame_slot.get
+            )
+            yield frame
+
+    async def __stream_loop(self, reader: asyncio.StreamReader) -> None:
+        """
+        Read the video socket, decode chunks on the executor
+        """
+        loop = asyncio.get_event_loop()
+        try:
+            while self.alive:
+                raw_h264 = await reader.read(0x10000)
+                if not raw_h264:
+                    break
+                seq = self.client.frame_slot.seq
+                await loop.run_in_executor(self.executor, self.client.feed, raw_h264)
+                if self.client.frame_slot.seq != seq:
+                    async with self.__frame_cond:
+                        self.__frame_cond.notify_all()
+        except OSError:
+            pass
+        await self.stop()
+
+    async def __control_loop(self) -> None:
+        """
+        Read device messages from the control socket
+        """
+        try:
+            await self.control.receive_loop()
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+        await self.stop()
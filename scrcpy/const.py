@@ -297,6 +297,8 @@ KEYCODE_KEYCODE_THUMBS_DOWN = 287
 # Event
 EVENT_INIT = "init"
 EVENT_FRAME = "frame"
+EVENT_IDLE = "idle"
+EVENT_CLIPBOARD = "clipboard"
 
 # Type
 TYPE_INJECT_KEYCODE = 0
@@ -312,6 +314,13 @@ TYPE_SET_CLIPBOARD = 9
 TYPE_SET_SCREEN_POWER_MODE = 10
 TYPE_ROTATE_DEVICE = 11
 
+# Device message type, sent by the server on the control socket
+DEVICE_MSG_TYPE_CLIPBOARD = 0
+DEVICE_MSG_TYPE_ACK_CLIPBOARD = 1
+
+# Longest text the server accepts in one TYPE_INJECT_TEXT message, in utf-8 bytes
+INJECT_TEXT_MAX_LENGTH = 300
+
 # Lock screen orientation
 LOCK_SCREEN_ORIENTATION_UNLOCKED = -1
 LOCK_SCREEN_ORIENTATION_INITIAL = -2
@@ -323,3 +332,38 @@ LOCK_SCREEN_ORIENTATION_3 = 3
 # Screen power mode
 POWER_MODE_OFF = 0
 POWER_MODE_NORMAL = 2
+
+# Gesture easing
+EASING_LINEAR = "linear"
+EASING_IN = "ease_in"
+EASING_OUT = "ease_out"
+EASING_IN_OUT = "ease_in_out"
+
+# Drop policy, applied when a pipeline queue is full
+DROP_POLICY_BLOCK = "block"
+DROP_POLICY_OLDEST = "oldest"
+DROP_POLICY_NEWEST = "newest"
+
+# Frame delivery
+DELIVERY_ALL = "all"
+DELIVERY_LATEST = "latest"
+
+# Decoder thread type
+DECODER_THREAD_SLICE = "SLICE"
+DECODER_THREAD_FRAME = "FRAME"
+DECODER_THREAD_AUTO = "AUTO"
+
+# H.264 NAL unit type
+NAL_TYPE_SLICE = 1
+NAL_TYPE_IDR = 5
+NAL_TYPE_SEI = 6
+NAL_TYPE_SPS = 7
+NAL_TYPE_PPS = 8
+NAL_TYPE_AUD = 9
+
+# Server startup, the server logs the device line right before opening its socket
+SERVER_READY_MARKER = b"INFO: Device:"
+SERVER_READY_MAX_OUTPUT = 0x1000
+# Connection retry delays, unit is second
+CONNECT_BACKOFF_MIN = 0.005
+CONNECT_BACKOFF_MAX = 0.2
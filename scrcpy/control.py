@@ -1,39 +1,273 @@
 import functools
+import math
 import socket
 import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
 from time import sleep
-
-import scrcpy
-from scrcpy import const
-
-
-def inject(control_type: int):
+from typing import Any, Deque, Iterable, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from scrcpy import const, gesture
+from scrcpy.gesture import TOUCH_EVENT_DTYPE, Track
+from scrcpy.scheduler import default_scheduler
+
+# Fixed size messages, control type included
+KEYCODE_STRUCT = struct.Struct(">BBiii")
+TOUCH_STRUCT = struct.Struct(">BBqiiHHHi")
+SCROLL_STRUCT = struct.Struct(">BiiHHii")
+TEXT_HEADER_STRUCT = struct.Struct(">Bi")
+
+# Touch event layout on the wire, matches TOUCH_STRUCT
+TOUCH_WIRE_DTYPE = np.dtype(
+    [
+        ("type", "u1"),
+        ("action", "u1"),
+        ("touch_id", ">i8"),
+        ("x", ">i4"),
+        ("y", ">i4"),
+        ("width", ">u2"),
+        ("height", ">u2"),
+        ("pressure", ">u2"),
+        ("buttons", ">i4"),
+    ]
+)
+
+
+def inject(control_type: int, packer: Optional[struct.Struct] = None):
     """
     Inject control code, with this inject, we will be able to do unit test
 
     Args:
         control_type: event to send, TYPE_*
+        packer: struct of a fixed size message, the function then returns the fields after control type.
+            Otherwise, the function returns the packed payload
     """
+    header = struct.pack(">B", control_type)
 
     def wrapper(f):
         @functools.wraps(f)
         def inner(*args, **kwargs):
-            package = struct.pack(">B", control_type) + f(*args, **kwargs)
-            if args[0].parent.control_socket is not None:
-                with args[0].parent.control_socket_lock:
-                    args[0].parent.control_socket.send(package)
-            return package
+            if packer is None:
+                package = header + f(*args, **kwargs)
+            else:
+                package = packer.pack(control_type, *f(*args, **kwargs))
+            return args[0].send(package)
 
         return inner
 
     return wrapper
 
 
+class TextStats(NamedTuple):
+    """
+    Result of ControlSender.type_text
+    """
+
+    chunks: int
+    bytes: int
+    seconds: float
+    bytes_per_second: float
+
+
+# Longest utf-8 encoding of a character
+UTF8_MAX_CHAR_LENGTH = 4
+
+
+def split_utf8(data: bytes, size: int) -> int:
+    """
+    Length of the longest prefix of data up to size bytes which doesn't cut a character
+
+    Args:
+        data: utf-8 bytes
+        size: maximum prefix length
+
+    Raises:
+        ValueError: size is smaller than the first character
+    """
+    if len(data) <= size:
+        return len(data)
+    cut = size
+    # Continuation bytes look like 0b10xxxxxx
+    while cut > 0 and data[cut] & 0xC0 == 0x80:
+        cut -= 1
+    if cut == 0:
+        raise ValueError(f"{size} bytes can't hold the first character")
+    return cut
+
+
+def recv_exactly(s: socket.socket, size: int) -> bytes:
+    """
+    Receive exactly size bytes from a blocking socket
+
+    Args:
+        s: socket to read
+        size: number of bytes
+
+    Raises:
+        ConnectionError: socket closed before size bytes
+    """
+    data = b""
+    while len(data) < size:
+        chunk = s.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Control socket closed")
+        data += chunk
+    return data
+
+
+class ControlWriter:
+    def __init__(
+        self, parent: Any, coalesce_moves: bool = False, flush_interval: float = 0
+    ):
+        """
+        Send control messages from a writer thread, messages queued meanwhile are joined into one sendall
+
+        Args:
+            parent: client owning control_socket and control_socket_lock
+            coalesce_moves: keep only the last of consecutive ACTION_MOVE touch events of the same pointer
+            flush_interval: seconds to gather messages after the first one before sending, 0 sends at once
+        """
+        assert flush_interval >= 0, "flush_interval must be greater than or equal to 0"
+
+        self.parent = parent
+        self.coalesce_moves = coalesce_moves
+        self.flush_interval = flush_interval
+
+        # Counters: messages queued, socket writes, move events merged into a later one
+        self.messages = 0
+        self.flushes = 0
+        self.coalesced = 0
+
+        self.alive = False
+        self.writer_thread = None
+
+        # deque append and popleft are atomic, producers never take a lock
+        self.__queue: Deque[bytes] = deque()
+        self.__event = threading.Event()
+
+    def start(self) -> None:
+        """
+        Start the writer thread
+        """
+        self.alive = True
+        self.writer_thread = threading.Thread(target=self.__loop, daemon=True)
+        self.writer_thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the writer thread, messages still queued are dropped
+        """
+        self.alive = False
+        self.__event.set()
+
+    def put(self, package: bytes) -> None:
+        """
+        Queue a packed message
+
+        Args:
+            package: packed control message
+        """
+        self.__queue.append(package)
+        self.messages += 1
+        self.__event.set()
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of queued messages
+        """
+        return len(self.__queue)
+
+    def flush(self) -> None:
+        """
+        Send every queued message now, in one write
+        """
+        with self.parent.control_socket_lock:
+            packages: List[bytes] = []
+            while True:
+                try:
+                    package = self.__queue.popleft()
+                except IndexError:
+                    break
+                if (
+                    self.coalesce_moves
+                    and packages
+                    and self.__same_move(packages[-1], package)
+                ):
+                    packages[-1] = package
+                    self.coalesced += 1
+                else:
+                    packages.append(package)
+            if packages:
+                self.parent.control_socket.sendall(b"".join(packages))
+                self.flushes += 1
+
+    def __loop(self) -> None:
+        """
+        Wait for messages and flush them
+        """
+        while self.alive:
+            self.__event.wait()
+            self.__event.clear()
+            if self.flush_interval:
+                sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:  # Socket Closed
+                self.alive = False
+
+    @staticmethod
+    def __same_move(previous: bytes, package: bytes) -> bool:
+        """
+        Check whether two messages are single ACTION_MOVE touch events of the same pointer,
+        touch_many batches are never merged
+
+        Args:
+            previous: message queued before package
+            package: message to check
+        """
+        return (
+            len(package) == TOUCH_STRUCT.size
+            and len(previous) == TOUCH_STRUCT.size
+            and package[0] == const.TYPE_INJECT_TOUCH_EVENT
+            and previous[0] == const.TYPE_INJECT_TOUCH_EVENT
+            and package[1] == const.ACTION_MOVE
+            and previous[1] == const.ACTION_MOVE
+            and package[2:10] == previous[2:10]
+        )
+
+
 class ControlSender:
     def __init__(self, parent):
         self.parent = parent
 
-    @inject(const.TYPE_INJECT_KEYCODE)
+        # Reused by touch_many, grown when a larger batch comes
+        self.__touch_buffer = np.zeros(0, TOUCH_WIRE_DTYPE)
+        self.__touch_buffer_lock = threading.Lock()
+
+    def send(self, package: bytes) -> bytes:
+        """
+        Send a packed message, through the control writer if there is one
+
+        Args:
+            package: packed control message
+
+        Returns:
+            the package
+        """
+        writer = getattr(self.parent, "control_writer", None)
+        if writer is not None:
+            writer.put(package)
+        elif self.parent.control_socket is not None:
+            with self.parent.control_socket_lock:
+                self.parent.control_socket.send(package)
+        return package
+
+    @inject(const.TYPE_INJECT_KEYCODE, KEYCODE_STRUCT)
     def keycode(
         self, keycode: int, action: int = const.ACTION_DOWN, repeat: int = 0
     ) -> bytes:
@@ -45,7 +279,7 @@ class ControlSender:
             action: ACTION_DOWN | ACTION_UP
             repeat: repeat count
         """
-        return struct.pack(">Biii", action, keycode, repeat, 0)
+        return action, keycode, repeat, 0
 
     @inject(const.TYPE_INJECT_TEXT)
     def text(self, text: str) -> bytes:
@@ -59,7 +293,73 @@ class ControlSender:
         buffer = text.encode("utf-8")
         return struct.pack(">i", len(buffer)) + buffer
 
-    @inject(const.TYPE_INJECT_TOUCH_EVENT)
+    def type_text(
+        self,
+        text: Union[str, Iterable[str]],
+        chunk_size: int = const.INJECT_TEXT_MAX_LENGTH,
+        max_bytes_per_second: float = 0,
+        max_pending: int = 16,
+    ) -> TextStats:
+        """
+        Send a long text, or a stream of text pieces, as several text messages.
+        Messages are cut on utf-8 character boundaries, at most chunk_size bytes each
+
+        Args:
+            text: str, or iterable of str pieces (e.g. a file opened in text mode)
+            chunk_size: utf-8 bytes per message, the server drops longer messages.
+                At least 4, the length of the longest utf-8 character
+            max_bytes_per_second: pace the messages, the device types each character as a key event.
+                0 sends as fast as the socket accepts them
+            max_pending: with batch_control, flush from this thread once that many messages are queued
+
+        Returns:
+            TextStats, counted from the first message
+        """
+        assert (
+            UTF8_MAX_CHAR_LENGTH <= chunk_size <= const.INJECT_TEXT_MAX_LENGTH
+        ), "chunk_size must be between 4 and INJECT_TEXT_MAX_LENGTH"
+        assert (
+            max_bytes_per_second >= 0
+        ), "max_bytes_per_second must be greater than or equal to 0"
+
+        pieces = [text] if isinstance(text, str) else text
+        writer = getattr(self.parent, "control_writer", None)
+        buffer = b""
+        chunks = sent = 0
+        start = time.monotonic()
+        for piece in pieces:
+            buffer += piece.encode("utf-8")
+            while len(buffer) >= chunk_size:
+                cut = split_utf8(buffer, chunk_size)
+                self.__send_text(buffer[:cut])
+                buffer = buffer[cut:]
+                chunks += 1
+                sent += cut
+                # Flow control: a bounded writer queue, then an optional rate
+                if writer is not None and writer.pending >= max_pending:
+                    writer.flush()
+                if max_bytes_per_second:
+                    delay = start + sent / max_bytes_per_second - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+        if buffer:
+            self.__send_text(buffer)
+            chunks += 1
+            sent += len(buffer)
+
+        seconds = time.monotonic() - start
+        return TextStats(chunks, sent, seconds, sent / seconds if seconds else 0.0)
+
+    def __send_text(self, data: bytes) -> None:
+        """
+        Send one text message
+
+        Args:
+            data: utf-8 bytes, at most INJECT_TEXT_MAX_LENGTH
+        """
+        self.send(TEXT_HEADER_STRUCT.pack(const.TYPE_INJECT_TEXT, len(data)) + data)
+
+    @inject(const.TYPE_INJECT_TOUCH_EVENT, TOUCH_STRUCT)
     def touch(
         self, x: int, y: int, action: int = const.ACTION_DOWN, touch_id: int = -1
     ) -> bytes:
@@ -72,20 +372,76 @@ class ControlSender:
             action: ACTION_DOWN | ACTION_UP | ACTION_MOVE
             touch_id: Default using virtual id -1, you can specify it to emulate multi finger touch
         """
-        x, y = max(x, 0), max(y, 0)
-        return struct.pack(
-            ">BqiiHHHi",
+        width, height = self.parent.resolution
+        return (
             action,
             touch_id,
-            int(x),
-            int(y),
-            int(self.parent.resolution[0]),
-            int(self.parent.resolution[1]),
+            max(int(x), 0),
+            max(int(y), 0),
+            width,
+            height,
             0xFFFF,
             1,
         )
 
-    @inject(const.TYPE_INJECT_SCROLL_EVENT)
+    def tap(self, x: int, y: int, hold: float = 0.1, touch_id: int = -1) -> Future:
+        """
+        Press now and release after hold seconds, without blocking the caller.
+        The release is sent by the shared scheduler thread
+
+        Args:
+            x: horizontal position
+            y: vertical position
+            hold: seconds between press and release
+            touch_id: pointer id
+
+        Returns:
+            Future resolved with the release message once it was sent
+        """
+        self.touch(x, y, const.ACTION_DOWN, touch_id)
+        return default_scheduler.call_later(
+            hold, lambda: self.touch(x, y, const.ACTION_UP, touch_id)
+        )
+
+    def touch_many(self, events: np.ndarray) -> bytes:
+        """
+        Send many touch events at once, serialized in one vectorized pass and sent in one write
+
+        Args:
+            events: structured array with fields x, y, action and touch_id, see TOUCH_EVENT_DTYPE
+
+        Returns:
+            the packed messages
+        """
+        count = len(events)
+        with self.__touch_buffer_lock:
+            if len(self.__touch_buffer) < count:
+                self.__touch_buffer = np.zeros(count, TOUCH_WIRE_DTYPE)
+            wire = self.__touch_buffer[:count]
+            width, height = self.parent.resolution
+            wire["type"] = const.TYPE_INJECT_TOUCH_EVENT
+            wire["action"] = events["action"]
+            wire["touch_id"] = events["touch_id"]
+            wire["x"] = np.maximum(events["x"], 0)
+            wire["y"] = np.maximum(events["y"], 0)
+            wire["width"] = width
+            wire["height"] = height
+            wire["pressure"] = 0xFFFF
+            wire["buttons"] = 1
+            package = wire.tobytes()
+        return self.send(package)
+
+    def multi_touch(self, tracks: List[Track]) -> None:
+        """
+        Play several pointers at once, e.g. pinch, multi finger swipe or parallel taps.
+        Events of all tracks are merged on one timeline, events due at the same time are sent in one write
+
+        Args:
+            tracks: one gesture.Track per pointer, give each pointer its own touch_id
+        """
+        gesture.play_tracks(self, tracks)
+
+    @inject(const.TYPE_INJECT_SCROLL_EVENT, SCROLL_STRUCT)
     def scroll(self, x: int, y: int, h: int, v: int) -> bytes:
         """
         Scroll screen
@@ -97,16 +453,8 @@ class ControlSender:
             v: vertical movement
         """
 
-        x, y = max(x, 0), max(y, 0)
-        return struct.pack(
-            ">iiHHii",
-            int(x),
-            int(y),
-            int(self.parent.resolution[0]),
-            int(self.parent.resolution[1]),
-            int(h),
-            int(v),
-        )
+        width, height = self.parent.resolution
+        return max(int(x), 0), max(int(y), 0), width, height, int(h), int(v)
 
     @inject(const.TYPE_BACK_OR_SCREEN_ON)
     def back_or_turn_screen_on(self, action: int = const.ACTION_DOWN) -> bytes:
@@ -139,13 +487,36 @@ class ControlSender:
         """
         return b""
 
-    def get_clipboard(self) -> str:
+    def request_clipboard(self) -> Future:
+        """
+        Ask for the clipboard without waiting, the reply is read by the client's device message reader
+
+        Returns:
+            Future resolved with the clipboard text
+        """
+        reader = getattr(self.parent, "device_message_reader", None)
+        assert reader is not None, "request_clipboard needs a device message reader"
+        future = reader.expect_clipboard()
+        self.send(struct.pack(">B", const.TYPE_GET_CLIPBOARD))
+        return future
+
+    def get_clipboard(self, timeout: Optional[float] = None) -> str:
         """
         Get clipboard
+
+        Args:
+            timeout: seconds to wait for the reply, None means wait forever (device message reader only)
         """
-        # Since this function need socket response, we can't auto inject it any more
+        if getattr(self.parent, "device_message_reader", None) is not None:
+            return self.request_clipboard().result(timeout)
+
+        # Without reader, read the reply here
         s: socket.socket = self.parent.control_socket
 
+        # Queued messages go first, and the writer thread must not write between request and reply
+        writer = getattr(self.parent, "control_writer", None)
+        if writer is not None:
+            writer.flush()
         with self.parent.control_socket_lock:
             # Flush socket
             s.setblocking(False)
@@ -159,11 +530,11 @@ class ControlSender:
             # Read package
             package = struct.pack(">B", const.TYPE_GET_CLIPBOARD)
             s.send(package)
-            (code,) = struct.unpack(">B", s.recv(1))
-            assert code == 0
-            (length,) = struct.unpack(">i", s.recv(4))
+            (code,) = struct.unpack(">B", recv_exactly(s, 1))
+            assert code == const.DEVICE_MSG_TYPE_CLIPBOARD
+            (length,) = struct.unpack(">i", recv_exactly(s, 4))
 
-            return s.recv(length).decode("utf-8")
+            return recv_exactly(s, length).decode("utf-8")
 
     @inject(const.TYPE_SET_CLIPBOARD)
     def set_clipboard(self, text: str, paste: bool = False) -> bytes:
@@ -178,7 +549,7 @@ class ControlSender:
         return struct.pack(">?i", paste, len(buffer)) + buffer
 
     @inject(const.TYPE_SET_SCREEN_POWER_MODE)
-    def set_screen_power_mode(self, mode: int = scrcpy.POWER_MODE_NORMAL) -> bytes:
+    def set_screen_power_mode(self, mode: int = const.POWER_MODE_NORMAL) -> bytes:
         """
         Set screen power mode
 
@@ -202,54 +573,32 @@ class ControlSender:
         end_y: int,
         move_step_length: int = 5,
         move_steps_delay: float = 0.005,
+        duration: Optional[float] = None,
+        easing: str = const.EASING_LINEAR,
+        touch_id: int = -1,
     ) -> None:
         """
-        Swipe on screen
+        Swipe on screen along a straight line, on a fixed time schedule
 
         Args:
             start_x: start horizontal position
             start_y: start vertical position
             end_x: start horizontal position
             end_y: end vertical position
-            move_step_length: length per step
-            move_steps_delay: sleep seconds after each step
-        :return:
+            move_step_length: length per step, used to derive duration if it is None
+            move_steps_delay: seconds between two moves
+            duration: seconds from press to release, default is one move_steps_delay per move_step_length
+                along the longest axis, like the former step loop
+            easing: EASING_*, speed curve of the move
+            touch_id: pointer id
         """
-
-        self.touch(start_x, start_y, const.ACTION_DOWN)
-        next_x = start_x
-        next_y = start_y
-
-        if end_x > self.parent.resolution[0]:
-            end_x = self.parent.resolution[0]
-
-        if end_y > self.parent.resolution[1]:
-            end_y = self.parent.resolution[1]
-
-        decrease_x = True if start_x > end_x else False
-        decrease_y = True if start_y > end_y else False
-        while True:
-            if decrease_x:
-                next_x -= move_step_length
-                if next_x < end_x:
-                    next_x = end_x
-            else:
-                next_x += move_step_length
-                if next_x > end_x:
-                    next_x = end_x
-
-            if decrease_y:
-                next_y -= move_step_length
-                if next_y < end_y:
-                    next_y = end_y
-            else:
-                next_y += move_step_length
-                if next_y > end_y:
-                    next_y = end_y
-
-            self.touch(next_x, next_y, const.ACTION_MOVE)
-
-            if next_x == end_x and next_y == end_y:
-                self.touch(next_x, next_y, const.ACTION_UP)
-                break
-            sleep(move_steps_delay)
+        end_x = min(end_x, self.parent.resolution[0])
+        end_y = min(end_y, self.parent.resolution[1])
+        if duration is None:
+            distance = max(abs(end_x - start_x), abs(end_y - start_y))
+            duration = max(math.ceil(distance / move_step_length), 1) * move_steps_delay
+
+        times, points = gesture.trajectory(
+            (start_x, start_y), (end_x, end_y), duration, move_steps_delay, easing
+        )
+        gesture.play(self, times, points, touch_id)
@@ -1,19 +1,60 @@
+import functools
+import hashlib
 import os
+import random
+import selectors
 import socket
 import struct
 import threading
 import time
+from queue import Empty, Full
 from time import sleep
-from typing import Any, Callable, Optional, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
-import cv2
 import numpy as np
 from adbutils import AdbConnection, AdbDevice, AdbError, Network, adb
 from av.codec import CodecContext
 from av.error import InvalidDataError
+from av.packet import Packet
+from av.video.frame import VideoFrame
 
-from .const import EVENT_FRAME, EVENT_INIT, LOCK_SCREEN_ORIENTATION_UNLOCKED,EVENT_FRAME_2
-from .control import ControlSender
+from . import h264
+from .const import (
+    CONNECT_BACKOFF_MAX,
+    CONNECT_BACKOFF_MIN,
+    DECODER_THREAD_SLICE,
+    DELIVERY_ALL,
+    DELIVERY_LATEST,
+    DROP_POLICY_BLOCK,
+    DROP_POLICY_OLDEST,
+    EVENT_CLIPBOARD,
+    EVENT_FRAME,
+    EVENT_IDLE,
+    EVENT_INIT,
+    LOCK_SCREEN_ORIENTATION_UNLOCKED,
+    SERVER_READY_MARKER,
+    SERVER_READY_MAX_OUTPUT,
+)
+from .control import ControlSender, ControlWriter
+from .decoder import create_codec
+from .device_message import DeviceMessageReader
+from .frame import Frame, FramePool
+from .pipeline import BoundedQueue, LatestFrame
+from .process import DecoderProcess, shared_memory
+
+
+@functools.lru_cache(maxsize=8)
+def file_digest(path: str, size: int, mtime: float) -> str:
+    """
+    sha256 of a file, cached while its size and mtime are unchanged
+
+    Args:
+        path: file path
+        size: file size, part of the cache key
+        mtime: file modification time, part of the cache key
+    """
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
 
 
 class Client:
@@ -29,6 +70,26 @@ class Client:
         lock_screen_orientation: int = LOCK_SCREEN_ORIENTATION_UNLOCKED,
         connection_timeout: int = 3000,
         encoder_name: Optional[str] = None,
+        pipelined: bool = False,
+        packet_queue_size: int = 64,
+        packet_drop_policy: str = DROP_POLICY_BLOCK,
+        frame_queue_size: int = 2,
+        frame_drop_policy: str = DROP_POLICY_OLDEST,
+        delivery: str = DELIVERY_ALL,
+        lazy_frame: bool = False,
+        frame_pool_size: int = 0,
+        decoder_threads: int = 1,
+        decoder_thread_type: str = DECODER_THREAD_SLICE,
+        keyframes_only: bool = False,
+        keyframe_interval: float = 0,
+        idle_timeout: float = 0.01,
+        decode_process: bool = False,
+        process_ring_size: int = 4,
+        batch_control: bool = False,
+        coalesce_moves: bool = False,
+        control_flush_interval: float = 0,
+        read_device_messages: bool = True,
+        deploy_cache: bool = True,
     ):
         """
         Create a scrcpy client, this client won't be started until you call the start function
@@ -39,11 +100,40 @@ class Client:
             bitrate: bitrate
             max_fps: maximum fps, 0 means not limited (supported after android 10)
             flip: flip the video
-            block_frame: only return nonempty frames, may block cv2 render thread
+            block_frame: only return nonempty frames, may block cv2 render thread.
+                Otherwise frame listeners receive None after each idle_timeout without data
             stay_awake: keep Android device awake
             lock_screen_orientation: lock screen orientation, LOCK_SCREEN_ORIENTATION_*
             connection_timeout: timeout for connection, unit is ms
             encoder_name: encoder name, enum: [OMX.google.h264.encoder, OMX.qcom.video.encoder.avc, c2.qti.avc.encoder, c2.android.avc.encoder], default is None (Auto)
+            pipelined: read socket, decode and deliver frames in separate threads, so slow listeners won't stall the socket.
+                Frame listeners never receive None in this mode
+            packet_queue_size: capacity of the queue between socket reader and decoder (pipelined only)
+            packet_drop_policy: DROP_POLICY_*, what the reader does when the packet queue is full (pipelined only)
+            frame_queue_size: capacity of the queue between decoder and listeners (pipelined only)
+            frame_drop_policy: DROP_POLICY_*, what the decoder does when the frame queue is full (pipelined only)
+            delivery: DELIVERY_ALL converts every frame, DELIVERY_LATEST only converts frames that are read (last_frame, wait_frame or frame listeners).
+                Frame listeners read every frame, so DELIVERY_LATEST only saves work without them
+            lazy_frame: send scrcpy.Frame to frame listeners and wait_frame instead of bgr ndarray, nothing is converted until accessed.
+                last_frame is always a bgr ndarray, it converts the latest frame on access
+            frame_pool_size: convert frames into a ring of this many pre-allocated bgr buffers, 0 allocates per frame.
+                Pooled frames are borrowed, a listener keeping a frame longer than frame_pool_size frames must copy it
+            decoder_threads: h264 decoder thread count, 0 picks one from cpu count and resolution
+            decoder_thread_type: DECODER_THREAD_*, frame threading adds (decoder_threads - 1) frames of latency
+            keyframes_only: low power mode, drop every packet but keyframes (IDR) and parameter sets before decoding
+            keyframe_interval: ask the server for a keyframe every this many seconds, 0 keeps the encoder default.
+                Controls the frame rate of keyframes_only mode
+            idle_timeout: seconds without video data before an idle event is sent, unit is second.
+                The stream loop sleeps until data arrives if there is no idle listener and block_frame is set
+            decode_process: decode and convert in a worker process, frames come back through shared memory (Python 3.8+).
+                Frames are borrowed like with frame_pool_size, can't be combined with pipelined, lazy_frame or frame_pool_size
+            process_ring_size: number of frames in the shared memory ring (decode_process only)
+            batch_control: send control messages from a writer thread, a burst of messages is sent in one write
+            coalesce_moves: drop ACTION_MOVE touch events followed by another move of the same pointer in the same batch (batch_control only)
+            control_flush_interval: seconds the writer gathers messages before a write, unit is second (batch_control only)
+            read_device_messages: read the control socket on a dedicated thread (in the selector loop of a DeviceHub), clipboard replies resolve futures
+                and clipboard listeners receive device clipboard changes. Otherwise get_clipboard reads the reply itself
+            deploy_cache: skip pushing the server jar if the device already has this exact jar
         """
         # Check Params
         assert max_width >= 0, "max_width must be greater than or equal to 0"
@@ -62,6 +152,32 @@ class Client:
             "c2.qti.avc.encoder",
             "c2.android.avc.encoder",
         ]
+        assert packet_queue_size > 0, "packet_queue_size must be greater than 0"
+        assert frame_queue_size > 0, "frame_queue_size must be greater than 0"
+        assert idle_timeout > 0, "idle_timeout must be greater than 0"
+        assert (
+            keyframe_interval >= 0
+        ), "keyframe_interval must be greater than or equal to 0"
+        assert (
+            decoder_threads >= 0
+        ), "decoder_threads must be greater than or equal to 0"
+        assert (
+            frame_pool_size >= 0
+        ), "frame_pool_size must be greater than or equal to 0"
+        assert not decode_process or not (
+            pipelined or lazy_frame or frame_pool_size
+        ), "decode_process can't be combined with pipelined, lazy_frame or frame_pool_size"
+        assert (
+            not decode_process or shared_memory is not None
+        ), "decode_process requires Python 3.8+"
+        assert (
+            control_flush_interval >= 0
+        ), "control_flush_interval must be greater than or equal to 0"
+        assert process_ring_size > 1, "process_ring_size must be greater than 1"
+        assert delivery in [
+            DELIVERY_ALL,
+            DELIVERY_LATEST,
+        ], "delivery must be DELIVERY_*"
 
         # Params
         self.flip = flip
@@ -73,6 +189,26 @@ class Client:
         self.lock_screen_orientation = lock_screen_orientation
         self.connection_timeout = connection_timeout
         self.encoder_name = encoder_name
+        self.pipelined = pipelined
+        self.packet_queue_size = packet_queue_size
+        self.packet_drop_policy = packet_drop_policy
+        self.frame_queue_size = frame_queue_size
+        self.frame_drop_policy = frame_drop_policy
+        self.delivery = delivery
+        self.lazy_frame = lazy_frame
+        self.decoder_threads = decoder_threads
+        self.decoder_thread_type = decoder_thread_type
+        self.keyframes_only = keyframes_only
+        self.keyframe_interval = keyframe_interval
+        self.idle_timeout = idle_timeout
+        self.decode_process = decode_process
+        self.process_ring_size = process_ring_size
+        self.batch_control = batch_control
+        self.coalesce_moves = coalesce_moves
+        self.control_flush_interval = control_flush_interval
+        self.read_device_messages = read_device_messages
+        self.deploy_cache = deploy_cache
+        self.frame_pool = FramePool(frame_pool_size) if frame_pool_size else None
 
         # Connect to device
         if device is None:
@@ -81,13 +217,20 @@ class Client:
             device = adb.device(serial=device)
 
         self.device = device
-        self.listeners = dict(frame=[], init=[])
+        self.listeners = dict(frame=[], init=[], idle=[], clipboard=[])
 
         # User accessible
-        self.last_frame: Optional[np.ndarray] = None
+        self.frame_slot = LatestFrame(self.__output_frame)
         self.resolution: Optional[Tuple[int, int]] = None
         self.device_name: Optional[str] = None
         self.control = ControlSender(self)
+        # Whether the last start pushed the server jar, and its duration from deploy to handshake, unit is second
+        self.server_pushed = False
+        self.startup_time: Optional[float] = None
+        # Duration of each startup phase of the last start: push, spawn, socket, handshake, unit is second
+        self.startup_phases: Dict[str, float] = {}
+        # Whether the server announced it was ready, otherwise the socket was polled from the spawn
+        self.server_ready = False
 
         # Need to destroy
         self.alive = False
@@ -95,26 +238,50 @@ class Client:
         self.__video_socket: Optional[socket.socket] = None
         self.control_socket: Optional[socket.socket] = None
         self.control_socket_lock = threading.Lock()
+        self.__wakeup_socket: Optional[socket.socket] = None
+        self.__feed_codec: Optional[CodecContext] = None
 
         # Available if start with threaded or daemon_threaded
         self.stream_loop_thread = None
 
+        # Available if read_device_messages
+        self.device_message_reader: Optional[DeviceMessageReader] = None
+
+        # Available if batch_control
+        self.control_writer: Optional[ControlWriter] = None
+
+        # Available if decode_process
+        self.decoder_process: Optional[DecoderProcess] = None
+
+        # Available if pipelined
+        self.packet_queue: Optional[BoundedQueue] = None
+        self.frame_queue: Optional[BoundedQueue] = None
+
     def __init_server_connection(self) -> None:
         """
         Connect to android server, there will be two sockets, video and control socket.
         This method will set: video_socket, control_socket, resolution variables
         """
-        for _ in range(self.connection_timeout // 100):
+        start = time.monotonic()
+        deadline = start + self.connection_timeout / 1000
+        delay = CONNECT_BACKOFF_MIN
+        while True:
             try:
                 self.__video_socket = self.device.create_connection(
                     Network.LOCAL_ABSTRACT, "scrcpy"
                 )
                 break
             except AdbError:
-                sleep(0.1)
-                pass
-        else:
-            raise ConnectionError("Failed to connect scrcpy-server after 3 seconds")
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ConnectionError(
+                        f"Failed to connect scrcpy-server after {self.connection_timeout} ms"
+                    )
+                # Jittered, so clients started together don't retry in lockstep
+                sleep(min(delay * random.uniform(0.5, 1), remaining))
+                delay = min(delay * 2, CONNECT_BACKOFF_MAX)
+        handshake_start = time.monotonic()
+        self.startup_phases["socket"] = handshake_start - start
 
         dummy_byte = self.__video_socket.recv(1)
         if not len(dummy_byte) or dummy_byte != b"\x00":
@@ -130,6 +297,7 @@ class Client:
         res = self.__video_socket.recv(4)
         self.resolution = struct.unpack(">HH", res)
         self.__video_socket.setblocking(False)
+        self.startup_phases["handshake"] = time.monotonic() - handshake_start
 
     def __deploy_server(self) -> None:
         """
@@ -139,7 +307,10 @@ class Client:
         server_file_path = os.path.join(
             os.path.abspath(os.path.dirname(__file__)), jar_name
         )
-        self.device.sync.push(server_file_path, f"/data/local/tmp/{jar_name}")
+        start = time.monotonic()
+        remote_path = self.__push_server(server_file_path)
+        spawn_start = time.monotonic()
+        self.startup_phases["push"] = spawn_start - start
         # commands = [
         #     f"CLASSPATH=/data/local/tmp/{jar_name}",
         #     "app_process",
@@ -163,14 +334,15 @@ class Client:
         #     "false",  # Power off screen after server closed
         # ]
         commands = [
-            f"CLASSPATH=/data/local/tmp/{jar_name}",
+            f"CLASSPATH={remote_path}",
             "app_process",
             "/",
             "com.genymobile.scrcpy.Server",
             "1.24",  # Scrcpy server version
             "log_level=debug",  # Log level: info, verbose...
-            'tunnel_forward=true',
-            'control=true',
+            "tunnel_forward=true",
+            "control=true",
+            *self.__codec_options(),
             # f"{self.max_width}",  # Max screen width (long side)
             # f"{self.bitrate}",  # Bitrate of video
             # f"{self.max_fps}",  # Max frame per second
@@ -192,8 +364,65 @@ class Client:
             stream=True,
         )
 
-        # Wait for server to start
-        self.__server_stream.read(10)
+        self.server_ready = self.__wait_server_ready()
+        self.startup_phases["spawn"] = time.monotonic() - spawn_start
+
+    def __wait_server_ready(self) -> bool:
+        """
+        Read the server output until it logs the device line, its socket is opened right after.
+        Stops early if the output ends or is not the expected one
+
+        Returns:
+            whether the line was seen
+        """
+        output = b""
+        try:
+            while len(output) < SERVER_READY_MAX_OUTPUT:
+                # Lines are short and the stream reads fully, read bytes one by one
+                chunk = self.__server_stream.read(1)
+                if not chunk:
+                    break
+                output += chunk
+                tail = output[-len(chunk) - len(SERVER_READY_MARKER) :]
+                if SERVER_READY_MARKER in tail:
+                    return True
+        except (OSError, AdbError):
+            pass
+        return False
+
+    def __push_server(self, local_path: str) -> str:
+        """
+        Push the server jar under a name derived from its content,
+        the push is skipped if a file of the same name and size is already on the device
+
+        Args:
+            local_path: path of the jar on this machine
+
+        Returns:
+            path of the jar on the device
+        """
+        size = os.path.getsize(local_path)
+        digest = file_digest(local_path, size, os.path.getmtime(local_path))
+        remote_path = f"/data/local/tmp/scrcpy-server-{digest[:16]}.jar"
+
+        # A partial push leaves a shorter file
+        self.server_pushed = (
+            not self.deploy_cache or self.device.sync.stat(remote_path).size != size
+        )
+        if self.server_pushed:
+            self.device.sync.push(local_path, remote_path)
+        return remote_path
+
+    def __codec_options(self) -> List[str]:
+        """
+        Server arguments for MediaCodec options, scrcpy's format is key[:type]=value
+        """
+        if not self.keyframe_interval:
+            return []
+        interval = self.keyframe_interval
+        if float(interval).is_integer():
+            return [f"codec_options=i-frame-interval={int(interval)}"]
+        return [f"codec_options=i-frame-interval:float={interval}"]
 
     def start(self, threaded: bool = False, daemon_threaded: bool = False) -> None:
         """
@@ -203,12 +432,7 @@ class Client:
             threaded: Run stream loop in a different thread to avoid blocking
             daemon_threaded: Run stream loop in a daemon thread to avoid blocking
         """
-        assert self.alive is False
-
-        self.__deploy_server()
-        self.__init_server_connection()
-        self.alive = True
-        self.__send_to_listeners(EVENT_INIT)
+        self.connect()
 
         if threaded or daemon_threaded:
             self.stream_loop_thread = threading.Thread(
@@ -218,11 +442,106 @@ class Client:
         else:
             self.__stream_loop()
 
+    def reconnect(self) -> None:
+        """
+        Stop and start again in a thread (daemon if it was), listeners, buffers and settings are kept.
+        The server jar is not pushed again if deploy_cache is set
+        """
+        thread = self.stream_loop_thread
+        self.stop()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self.start(threaded=True, daemon_threaded=thread is not None and thread.daemon)
+
+    def connect(self, threaded_reader: bool = True) -> None:
+        """
+        Deploy the server and connect, without starting the stream loop.
+        Video data is then read by someone else and passed to feed, see DeviceHub
+
+        Args:
+            threaded_reader: read device messages on a dedicated thread (read_device_messages only),
+                otherwise the caller passes control socket data to device_message_reader.feed
+        """
+        assert self.alive is False
+
+        start = time.monotonic()
+        self.startup_phases = {}
+        self.__deploy_server()
+        self.__init_server_connection()
+        self.startup_time = time.monotonic() - start
+        if self.frame_pool is not None:
+            self.frame_pool.resize(self.resolution)
+        self.alive = True
+        self.frame_slot.open()
+        if self.read_device_messages:
+            self.device_message_reader = DeviceMessageReader(
+                self.control_socket,
+                lambda text: self.__send_to_listeners(EVENT_CLIPBOARD, text),
+            )
+            self.device_message_reader.start(threaded_reader)
+        if self.batch_control:
+            self.control_writer = ControlWriter(
+                self, self.coalesce_moves, self.control_flush_interval
+            )
+            self.control_writer.start()
+        self.__send_to_listeners(EVENT_INIT)
+
+        if self.pipelined:
+            self.__start_pipeline()
+        if self.decode_process:
+            self.decoder_process = DecoderProcess(
+                self.__handle_bgr,
+                self.flip,
+                self.keyframes_only,
+                self.decoder_threads,
+                self.decoder_thread_type,
+                self.resolution,
+                self.process_ring_size,
+            )
+            self.decoder_process.start()
+
+    @property
+    def video_socket(self) -> Optional[AdbConnection]:
+        """
+        Video socket, non-blocking once connected
+        """
+        return self.__video_socket
+
+    def feed(self, raw_h264: bytes) -> None:
+        """
+        Parse and decode a chunk read from the video socket, frames go to the listeners.
+        Chunks must be fed in order, from one thread at a time
+
+        Args:
+            raw_h264: bytes received from video_socket
+        """
+        if self.__feed_codec is None:
+            self.__feed_codec = self.__create_codec()
+        try:
+            self.__process(self.__feed_codec, raw_h264)
+        except InvalidDataError:
+            pass
+
     def stop(self) -> None:
         """
         Stop listening (both threaded and blocked)
         """
         self.alive = False
+        self.frame_slot.close()
+        if self.control_writer is not None:
+            self.control_writer.stop()
+            self.control_writer = None
+        if self.device_message_reader is not None:
+            self.device_message_reader.stop()
+            self.device_message_reader = None
+        if self.decoder_process is not None:
+            self.decoder_process.stop()
+            self.decoder_process = None
+        if self.__wakeup_socket is not None:
+            try:
+                self.__wakeup_socket.send(b"\x00")
+            except OSError:
+                pass
         if self.__server_stream is not None:
             self.__server_stream.close()
         if self.control_socket is not None:
@@ -230,38 +549,335 @@ class Client:
         if self.__video_socket is not None:
             self.__video_socket.close()
 
+    def __start_pipeline(self) -> None:
+        """
+        Create the stage queues, start decoder and delivery threads
+        """
+        self.packet_queue = BoundedQueue(
+            self.packet_queue_size, self.packet_drop_policy
+        )
+        self.frame_queue = BoundedQueue(self.frame_queue_size, self.frame_drop_policy)
+        threading.Thread(
+            target=self.__decode_loop,
+            args=(self.packet_queue, self.frame_queue),
+            daemon=True,
+        ).start()
+        threading.Thread(
+            target=self.__delivery_loop, args=(self.frame_queue,), daemon=True
+        ).start()
+
     def __stream_loop(self) -> None:
         """
-        Core loop for video parsing
+        Core loop for video parsing, packets are handed to the decoder stage if pipelined
         """
-        codec = CodecContext.create("h264", "r")
-        while self.alive:
+        video_socket = self.__video_socket
+        codec = self.__create_codec()
+        selector = self.__create_selector(video_socket)
+        try:
+            self.__read_loop(video_socket, codec, selector)
+        finally:
+            self.__close_selector(video_socket, selector)
+
+    def __read_loop(
+        self,
+        video_socket: Any,
+        codec: CodecContext,
+        selector: Optional[selectors.BaseSelector],
+    ) -> None:
+        """
+        Read the video socket as soon as it is readable, parse and decode
+
+        Args:
+            video_socket: video socket of this run
+            codec: context used to parse, and to decode if not pipelined
+            selector: selector from __create_selector
+        """
+        # Sockets are replaced on reconnect, the loop of a previous run must quit even if alive again
+        while self.alive and video_socket is self.__video_socket:
             try:
-                raw_h264 = self.__video_socket.recv(0x10000)
-                packets = codec.parse(raw_h264)
-                for packet in packets:
-                    frames = codec.decode(packet)
-                    for frame in frames:
-                        frame = frame.to_ndarray(format="bgr24")
-                        if self.flip:
-                            frame = cv2.flip(frame, 1)
-                        self.last_frame = frame
-                        self.resolution = (frame.shape[1], frame.shape[0])
-                        self.__send_to_listeners(EVENT_FRAME, frame)
-            except (BlockingIOError, InvalidDataError):
-                time.sleep(0.01)
-                if not self.block_frame:
-                    self.__send_to_listeners(EVENT_FRAME, None)
+                raw_h264 = video_socket.recv(0x10000)
+                if not raw_h264:
+                    raise ConnectionError("Video socket closed by server")
+                self.__process(codec, raw_h264)
+            except BlockingIOError:
+                if not self.__wait_readable(selector):
+                    self.__on_idle()
+            except InvalidDataError:
+                continue
             except OSError as e:  # Socket Closed
-                if self.alive:
+                if self.alive and video_socket is self.__video_socket:
                     raise e
 
+    def __process(self, codec: CodecContext, raw_h264: bytes) -> None:
+        """
+        Parse raw h264, then decode the packets or hand them to the decoder stage if pipelined
+
+        Args:
+            codec: context used to parse, and to decode if not pipelined
+            raw_h264: bytes received from the video socket
+        """
+        if self.decoder_process is not None:
+            self.decoder_process.feed(raw_h264)
+            return
+        packets = codec.parse(raw_h264)
+        for i, packet in enumerate(packets):
+            if self.keyframes_only and not h264.is_resync_point(packet):
+                continue
+            if self.packet_queue is not None:
+                self.__put(self.packet_queue, packet)
+                continue
+            if self.__skippable(packet, i < len(packets) - 1):
+                continue
+            frames = codec.decode(packet)
+            for frame in frames:
+                self.__handle_frame(frame)
+
+    def __create_selector(self, video_socket: Any) -> Optional[selectors.BaseSelector]:
+        """
+        Selector watching the video socket and a wakeup socket written by stop,
+        None if the video stream has no file descriptor
+
+        Args:
+            video_socket: video socket of this run
+        """
+        try:
+            video_socket.fileno()
+        except (AttributeError, OSError):
+            return None
+        selector = selectors.DefaultSelector()
+        selector.register(video_socket, selectors.EVENT_READ)
+        wakeup_reader, wakeup_writer = socket.socketpair()
+        selector.register(wakeup_reader, selectors.EVENT_READ, wakeup_writer)
+        self.__wakeup_socket = wakeup_writer
+        return selector
+
+    def __close_selector(
+        self, video_socket: Any, selector: Optional[selectors.BaseSelector]
+    ) -> None:
+        """
+        Close the selector and its wakeup sockets, the ones of a newer run are kept
+
+        Args:
+            video_socket: video socket of this run
+            selector: selector from __create_selector
+        """
+        if selector is None:
+            return
+        for key in list(selector.get_map().values()):
+            if key.fileobj is video_socket:
+                continue
+            key.fileobj.close()
+            key.data.close()
+            if self.__wakeup_socket is key.data:
+                self.__wakeup_socket = None
+        selector.close()
+
+    def __wait_readable(self, selector: Optional[selectors.BaseSelector]) -> bool:
+        """
+        Block until the video socket is readable, stop is called, or idle_timeout passes
+
+        Args:
+            selector: selector from __create_selector
+
+        Returns:
+            False if idle_timeout passed without data
+        """
+        if selector is None:
+            time.sleep(self.idle_timeout)
+            return False
+        timeout = None
+        if self.listeners[EVENT_IDLE] or not self.block_frame:
+            timeout = self.idle_timeout
+        return len(selector.select(timeout)) > 0
+
+    def __on_idle(self) -> None:
+        """
+        Send idle event, and the legacy None frame if block_frame is not set
+        """
+        self.__send_to_listeners(EVENT_IDLE)
+        if not self.block_frame and self.frame_queue is None:
+            self.__send_to_listeners(EVENT_FRAME, None)
+
+    def __decode_loop(self, packets: BoundedQueue, frames: BoundedQueue) -> None:
+        """
+        Decoder stage, packets queue -> frames queue
+
+        Args:
+            packets: queue filled by the stream loop
+            frames: queue consumed by the delivery stage
+        """
+        # Reader parses with its own context, the parser is not safe to share across threads
+        codec = self.__create_codec()
+        dropped = 0
+        resync = False
+        # Queues are replaced on restart, the stage of a previous run must quit
+        while self.alive and packets is self.packet_queue:
+            try:
+                packet = packets.get(timeout=0.1)
+            except Empty:
+                continue
+
+            # Reference frames are gone with the dropped packets, wait for next keyframe or SPS
+            if packets.dropped != dropped:
+                dropped = packets.dropped
+                resync = True
+            if resync:
+                if not h264.is_resync_point(packet):
+                    continue
+                resync = False
+            if self.__skippable(packet, len(packets) > 0):
+                continue
+
+            try:
+                for frame in codec.decode(packet):
+                    self.__put(frames, frame)
+            except InvalidDataError:
+                pass
+            except Exception:
+                # Stop the reader too, it would block forever on a full queue
+                self.alive = False
+                raise
+
+    def __delivery_loop(self, frames: BoundedQueue) -> None:
+        """
+        Delivery stage, frames queue -> listeners
+
+        Args:
+            frames: queue filled by the decoder stage
+        """
+        while self.alive and frames is self.frame_queue:
+            try:
+                frame = frames.get(timeout=0.1)
+            except Empty:
+                continue
+            self.__handle_frame(frame)
+
+    def __create_codec(self) -> CodecContext:
+        """
+        Create the h264 decoder with the configured threading
+        """
+        return create_codec(
+            self.decoder_threads, self.decoder_thread_type, self.resolution
+        )
+
+    def __put(self, queue: BoundedQueue, item: Any) -> None:
+        """
+        Put item into a stage queue, keep retrying while alive if the queue blocks
+
+        Args:
+            queue: stage queue
+            item: packet or frame
+        """
+        while self.alive:
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    def __skippable(self, packet: Packet, superseded: bool) -> bool:
+        """
+        Whether decoding a packet can be skipped: in DELIVERY_LATEST mode without frame listeners,
+        a non-reference frame followed by a newer packet would be overwritten before anybody reads it
+
+        Args:
+            packet: parsed packet
+            superseded: a newer packet is already available
+        """
+        return (
+            superseded
+            and self.delivery == DELIVERY_LATEST
+            and not self.listeners[EVENT_FRAME]
+            and h264.is_disposable(packet)
+        )
+
+    def __handle_frame(self, frame: VideoFrame) -> None:
+        """
+        Publish a decoded frame, convert it and send it to listeners if needed
+
+        Args:
+            frame: decoded frame
+        """
+        self.resolution = (frame.width, frame.height)
+        self.__publish(Frame(frame, self.flip, self.frame_pool))
+
+    def __handle_bgr(self, frame: np.ndarray) -> None:
+        """
+        Publish a bgr frame converted by the decoder process
+
+        Args:
+            frame: bgr frame, borrowed from the shared memory ring
+        """
+        self.resolution = (frame.shape[1], frame.shape[0])
+        self.__publish(frame)
+
+    def __publish(self, frame: Union[Frame, np.ndarray]) -> None:
+        """
+        Store the latest frame, convert it and send it to listeners if needed
+
+        Args:
+            frame: wrapped decoded frame, or bgr ndarray
+        """
+        self.frame_slot.publish(frame)
+        if self.delivery == DELIVERY_LATEST and not self.listeners[EVENT_FRAME]:
+            return
+        self.__send_to_listeners(EVENT_FRAME, self.frame_slot.get()[1])
+
+    def __output_frame(
+        self, frame: Union[Frame, np.ndarray]
+    ) -> Union[Frame, np.ndarray]:
+        """
+        Frame handed to consumers, bgr ndarray unless lazy_frame
+
+        Args:
+            frame: wrapped decoded frame, or ndarray set through last_frame
+        """
+        if self.lazy_frame or not isinstance(frame, Frame):
+            return frame
+        return frame.bgr
+
+    @property
+    def last_frame(self) -> Optional[np.ndarray]:
+        """
+        Latest frame as bgr ndarray, None if no frame yet, also with lazy_frame (use wait_frame to get scrcpy.Frame)
+        """
+        frame = self.frame_slot.get()[1]
+        return frame.bgr if isinstance(frame, Frame) else frame
+
+    @last_frame.setter
+    def last_frame(self, frame: Optional[np.ndarray]) -> None:
+        """
+        Replace the latest frame, waiting consumers receive it as a new frame
+
+        Args:
+            frame: bgr ndarray
+        """
+        self.frame_slot.publish(frame)
+
+    def wait_frame(
+        self, seq: int = 0, timeout: Optional[float] = None
+    ) -> Tuple[int, Optional[Union[Frame, np.ndarray]]]:
+        """
+        Wait for a frame newer than the one consumer has seen
+
+        Args:
+            seq: sequence number returned by the previous call, 0 for any frame
+            timeout: seconds to wait, None means wait forever
+
+        Returns:
+            (sequence number, bgr ndarray or Frame if lazy_frame), the sequence number is unchanged on timeout
+
+        Raises:
+            ConnectionError: the client is stopped and there is no newer frame
+        """
+        return self.frame_slot.wait(seq, timeout)
+
     def add_listener(self, cls: str, listener: Callable[..., Any]) -> None:
         """
         Add a video listener
 
         Args:
-            cls: Listener category, support: init, frame
+            cls: Listener category, support: init, frame, idle, clipboard
             listener: A function to receive frame np.ndarray
         """
         self.listeners[cls].append(listener)
@@ -271,7 +887,7 @@ class Client:
         Remove a video listener
 
         Args:
-            cls: Listener category, support: init, frame
+            cls: Listener category, support: init, frame, idle, clipboard
             listener: A function to receive frame np.ndarray
         """
         self.listeners[cls].remove(listener)
@@ -0,0 +1,56 @@
+"""
+H.264 decoder context factory and its threading configuration
+"""
+
+import math
+import os
+from typing import Optional, Tuple
+
+from av.codec import CodecContext
+
+from .const import DECODER_THREAD_AUTO, DECODER_THREAD_FRAME, DECODER_THREAD_SLICE
+
+# One decoder thread keeps up with about this many pixels per frame in real time
+PIXELS_PER_THREAD = 1280 * 720
+# FFmpeg's h264 decoder doesn't scale past this
+MAX_THREADS = 16
+
+
+def auto_thread_count(resolution: Optional[Tuple[int, int]]) -> int:
+    """
+    Pick a decoder thread count from cpu count and stream resolution
+
+    Args:
+        resolution: (width, height) of the stream, None if unknown
+    """
+    cpu_count = os.cpu_count() or 1
+    if resolution is None:
+        return min(cpu_count, 2)
+    wanted = math.ceil(resolution[0] * resolution[1] / PIXELS_PER_THREAD)
+    return max(1, min(wanted, cpu_count, MAX_THREADS))
+
+
+def create_codec(
+    threads: int = 1,
+    thread_type: str = DECODER_THREAD_SLICE,
+    resolution: Optional[Tuple[int, int]] = None,
+) -> CodecContext:
+    """
+    Create a h264 decoder context
+
+    Args:
+        threads: decoder thread count, 0 picks one from cpu count and resolution
+        thread_type: DECODER_THREAD_*, frame threading adds (threads - 1) frames of latency
+        resolution: (width, height) of the stream, used if threads is 0
+    """
+    assert threads >= 0, "threads must be greater than or equal to 0"
+    assert thread_type in [
+        DECODER_THREAD_SLICE,
+        DECODER_THREAD_FRAME,
+        DECODER_THREAD_AUTO,
+    ], "thread_type must be DECODER_THREAD_*"
+
+    codec = CodecContext.create("h264", "r")
+    codec.thread_count = threads or auto_thread_count(resolution)
+    codec.thread_type = thread_type
+    return codec
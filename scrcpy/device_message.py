@@ -0,0 +1,193 @@
+"""
+Messages sent by the server on the control socket
+"""
+
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+from .const import DEVICE_MSG_TYPE_ACK_CLIPBOARD, DEVICE_MSG_TYPE_CLIPBOARD
+
+
+class DeviceMessageParser:
+    def __init__(self):
+        """
+        Split the control socket byte stream into messages, partial messages are kept until complete
+        """
+        self.__buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[Tuple[int, Any]]:
+        """
+        Add received bytes, return the messages completed by them
+
+        Args:
+            data: bytes received from the control socket
+
+        Returns:
+            list of (DEVICE_MSG_TYPE_*, payload): clipboard text, or ack sequence number
+
+        Raises:
+            ConnectionError: unknown message type, the stream can't be framed anymore
+        """
+        self.__buffer += data
+        messages = []
+        while True:
+            message = self.__parse()
+            if message is None:
+                return messages
+            messages.append(message)
+
+    def __parse(self) -> Optional[Tuple[int, Any]]:
+        """
+        Pop the first message of the buffer, None if it is not complete yet
+        """
+        buffer = self.__buffer
+        if not buffer:
+            return None
+        message_type = buffer[0]
+        if message_type == DEVICE_MSG_TYPE_CLIPBOARD:
+            if len(buffer) < 5:
+                return None
+            (length,) = struct.unpack_from(">i", buffer, 1)
+            if len(buffer) < 5 + length:
+                return None
+            text = bytes(buffer[5 : 5 + length]).decode("utf-8")
+            del buffer[: 5 + length]
+            return message_type, text
+        if message_type == DEVICE_MSG_TYPE_ACK_CLIPBOARD:
+            if len(buffer) < 9:
+                return None
+            (sequence,) = struct.unpack_from(">Q", buffer, 1)
+            del buffer[:9]
+            return message_type, sequence
+        raise ConnectionError(f"Unknown device message type {message_type}")
+
+
+class DeviceMessageReader:
+    def __init__(
+        self,
+        control_socket: Any,
+        on_clipboard: Optional[Callable[[str], None]] = None,
+    ):
+        """
+        Read the control socket on a dedicated thread, so senders never wait for replies.
+        Clipboard messages resolve pending clipboard requests in order.
+        Without the thread, the owner of the socket reads it and calls feed, see DeviceHub
+
+        Args:
+            control_socket: connected control socket
+            on_clipboard: called with the text of every clipboard message, requested or not
+        """
+        self.control_socket = control_socket
+        self.on_clipboard = on_clipboard
+        self.alive = False
+        self.reader_thread: Optional[threading.Thread] = None
+
+        self.__parser = DeviceMessageParser()
+        self.__lock = threading.Lock()
+        self.__clipboard_waiters: Deque[Future] = deque()
+
+    def start(self, threaded: bool = True) -> None:
+        """
+        Start reading
+
+        Args:
+            threaded: read on a dedicated thread, otherwise received data must be passed to feed
+        """
+        self.alive = True
+        if threaded:
+            self.reader_thread = threading.Thread(target=self.__loop, daemon=True)
+            self.reader_thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop reading, pending clipboard requests fail with ConnectionError
+        """
+        self.alive = False
+        self.__fail(ConnectionError("Device message reader stopped"))
+
+    def expect_clipboard(self) -> Future:
+        """
+        Register a clipboard request, call it before sending the request
+
+        Returns:
+            Future resolved with the clipboard text
+        """
+        future: Future = Future()
+        with self.__lock:
+            if not self.alive:
+                future.set_exception(ConnectionError("Device message reader stopped"))
+            else:
+                self.__clipboard_waiters.append(future)
+        return future
+
+    def __loop(self) -> None:
+        """
+        Receive, frame and dispatch messages until the socket closes
+        """
+        try:
+            while self.alive:
+                try:
+                    data = self.control_socket.recv(0x10000)
+                except BlockingIOError:  # Non-blocking streams only
+                    time.sleep(0.01)
+                    continue
+                if not data:
+                    break
+                self.feed(data)
+        except OSError:  # Socket Closed, or ConnectionError from the parser
+            pass
+        self.close()
+
+    def feed(self, data: bytes) -> None:
+        """
+        Dispatch the messages completed by data received from the control socket
+
+        Args:
+            data: received bytes
+
+        Raises:
+            ConnectionError: unknown message type
+        """
+        for message_type, payload in self.__parser.feed(data):
+            if message_type == DEVICE_MSG_TYPE_CLIPBOARD:
+                self.__on_clipboard(payload)
+
+    def close(self) -> None:
+        """
+        Stop reading because the control socket closed, pending clipboard requests fail with ConnectionError
+        """
+        self.alive = False
+        self.__fail(ConnectionError("Control socket closed"))
+
+    def __on_clipboard(self, text: str) -> None:
+        """
+        Resolve the oldest clipboard request, call on_clipboard
+
+        Args:
+            text: clipboard text
+        """
+        with self.__lock:
+            waiter = (
+                self.__clipboard_waiters.popleft() if self.__clipboard_waiters else None
+            )
+        if waiter is not None and waiter.set_running_or_notify_cancel():
+            waiter.set_result(text)
+        if self.on_clipboard is not None:
+            self.on_clipboard(text)
+
+    def __fail(self, e: Exception) -> None:
+        """
+        Fail pending clipboard requests
+
+        Args:
+            e: exception set on the futures
+        """
+        with self.__lock:
+            waiters, self.__clipboard_waiters = self.__clipboard_waiters, deque()
+        for waiter in waiters:
+            if waiter.set_running_or_notify_cancel():
+                waiter.set_exception(e)
@@ -0,0 +1,253 @@
+"""
+Decoded frame wrapper, pixel format conversions happen on first access only
+"""
+
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from av.video.frame import VideoFrame
+
+PLANAR_YUV_FORMATS = ["yuv420p", "yuvj420p"]
+
+
+class FramePool:
+    def __init__(self, size: int, resolution: Optional[Tuple[int, int]] = None):
+        """
+        A ring of pre-allocated buffers that Frame.bgr converts into, instead of allocating per frame.
+
+        Buffers are borrowed, not owned: a buffer is overwritten once `size` newer frames were converted,
+        copy it (frame.bgr.copy()) to keep a frame longer than that.
+
+        Args:
+            size: number of buffers in the ring
+            resolution: (width, height) to allocate now, buffers are allocated on first use otherwise
+        """
+        assert size > 0, "size must be greater than 0"
+        self.size = size
+        self.resolution: Optional[Tuple[int, int]] = None
+
+        self.__slots: List[Tuple[np.ndarray, np.ndarray]] = []
+        self.__index = 0
+        self.__lock = threading.Lock()
+
+        if resolution is not None:
+            self.resize(resolution)
+
+    def resize(self, resolution: Tuple[int, int]) -> None:
+        """
+        Reallocate all buffers, e.g. after the device rotated
+
+        Args:
+            resolution: (width, height)
+        """
+        with self.__lock:
+            self.__allocate(resolution)
+
+    def acquire(self, width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Take the next buffers of the ring, resized to the frame size if needed
+
+        Args:
+            width: frame width
+            height: frame height
+
+        Returns:
+            (i420 staging buffer with shape (height * 3 / 2, width), bgr buffer with shape (height, width, 3))
+        """
+        with self.__lock:
+            if self.resolution != (width, height):
+                self.__allocate((width, height))
+            slot = self.__slots[self.__index]
+            self.__index = (self.__index + 1) % self.size
+            return slot
+
+    def __allocate(self, resolution: Tuple[int, int]) -> None:
+        """
+        Allocate the ring, the caller holds the lock
+
+        Args:
+            resolution: (width, height)
+        """
+        width, height = resolution
+        self.resolution = (width, height)
+        self.__slots = [
+            (
+                np.empty((height * 3 // 2, width), np.uint8),
+                np.empty((height, width, 3), np.uint8),
+            )
+            for _ in range(self.size)
+        ]
+        self.__index = 0
+
+
+class Frame:
+    def __init__(
+        self,
+        video_frame: VideoFrame,
+        flip: bool = False,
+        pool: Optional[FramePool] = None,
+    ):
+        """
+        Wrap a decoded frame, every conversion is computed at most once and cached
+
+        Args:
+            video_frame: frame returned by the h264 decoder
+            flip: flip the converted images horizontally
+            pool: convert bgr into the pool's buffers, see FramePool for ownership
+        """
+        self.video_frame = video_frame
+        self.flip = flip
+        self.pool = pool
+        self.width = video_frame.width
+        self.height = video_frame.height
+
+        self.__cache: Dict[str, Any] = {}
+        # Reentrant, a conversion may build on another one (gray reads y_plane)
+        self.__lock = threading.RLock()
+
+    @property
+    def bgr(self) -> np.ndarray:
+        """
+        bgr24 image (cv2's default format), shape (height, width, 3).
+        Borrowed from the pool if the frame has one, see FramePool
+        """
+        return self.__cached("bgr", self.__to_bgr)
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """
+        rgb24 image, shape (height, width, 3)
+        """
+        return self.__cached("rgb", lambda: self.__to_ndarray("rgb24"))
+
+    @property
+    def gray(self) -> np.ndarray:
+        """
+        Grayscale image, shape (height, width), a contiguous copy of the Y plane
+        """
+        return self.__cached("gray", self.__copy_y_plane)
+
+    @property
+    def y_plane(self) -> np.ndarray:
+        """
+        Zero-copy view of the luma (Y) plane, shape (height, width), usable as a grayscale image.
+
+        The view points into the decoder's buffer and follows its line size (rows are not contiguous),
+        call np.ascontiguousarray or use gray if an API needs a packed array.
+        The view is read-only, and it keeps the decoded frame buffer alive through the buffer protocol,
+        so it stays valid as long as it is referenced, even after the decoder produced newer frames.
+        Frames not in yuv420p are converted first, then the view points into the converted frame.
+        """
+        return self.__cached("y_plane", self.__view_y_plane)
+
+    @property
+    def yuv_planes(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Y, U and V planes of the yuv420p frame, U and V are half of the size of Y (rounded up).
+        Each plane is a contiguous copy without the decoder's line padding.
+        """
+        return self.__cached("yuv_planes", self.__split_planes)
+
+    def __cached(self, name: str, convert: Callable[[], Any]) -> Any:
+        """
+        Run a conversion once, concurrent readers wait for the first one
+
+        Args:
+            name: cache key
+            convert: conversion to run
+        """
+        with self.__lock:
+            if name not in self.__cache:
+                self.__cache[name] = convert()
+            return self.__cache[name]
+
+    def __to_ndarray(self, format: str) -> np.ndarray:
+        """
+        Convert the whole frame with swscale
+
+        Args:
+            format: packed pixel format, e.g. bgr24
+        """
+        image = self.video_frame.to_ndarray(format=format)
+        if self.flip:
+            image = cv2.flip(image, 1)
+        return image
+
+    def __to_bgr(self) -> np.ndarray:
+        """
+        Convert to bgr, in place into a pool buffer if possible
+        """
+        video_frame = self.video_frame
+        width, height = self.width, self.height
+        if (
+            self.pool is None
+            or video_frame.format.name not in PLANAR_YUV_FORMATS
+            or width % 2
+            or height % 2
+        ):
+            return self.__to_ndarray("bgr24")
+
+        # Pack the padded planes into the i420 layout expected by cv2
+        i420, bgr = self.pool.acquire(width, height)
+        chroma_size = (height // 2) * (width // 2)
+        targets = [
+            i420[:height],
+            i420[height:].reshape(-1)[:chroma_size].reshape(height // 2, width // 2),
+            i420[height:].reshape(-1)[chroma_size:].reshape(height // 2, width // 2),
+        ]
+        for plane, target in zip(video_frame.planes, targets):
+            data = np.frombuffer(plane, np.uint8).reshape(-1, plane.line_size)
+            np.copyto(target, data[: target.shape[0], : target.shape[1]])
+
+        cv2.cvtColor(i420, cv2.COLOR_YUV2BGR_I420, dst=bgr)
+        if self.flip:
+            cv2.flip(bgr, 1, dst=bgr)
+        return bgr
+
+    def __view_y_plane(self) -> np.ndarray:
+        """
+        Build the strided view of the Y plane, flipped by a negative stride if needed
+        """
+        video_frame = self.video_frame
+        if video_frame.format.name not in PLANAR_YUV_FORMATS:
+            video_frame = video_frame.reformat(format="yuv420p")
+
+        plane = video_frame.planes[0]
+        data = np.frombuffer(plane, np.uint8).reshape(-1, plane.line_size)
+        data = data[: self.height, : self.width]
+        if self.flip:
+            data = data[:, ::-1]
+        data.flags.writeable = False
+        return data
+
+    def __copy_y_plane(self) -> np.ndarray:
+        """
+        Pack the Y plane alone, the chroma planes are not copied
+        """
+        y_plane = self.y_plane
+        gray = np.ascontiguousarray(y_plane)
+        if gray is y_plane:
+            # Already packed, copy to own a writeable image like the other conversions
+            gray = y_plane.copy()
+        return gray
+
+    def __split_planes(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Copy the visible part of each plane, line padding is dropped
+        """
+        video_frame = self.video_frame
+        if video_frame.format.name not in PLANAR_YUV_FORMATS:
+            video_frame = video_frame.reformat(format="yuv420p")
+
+        planes = []
+        for i, plane in enumerate(video_frame.planes):
+            width = self.width if i == 0 else (self.width + 1) // 2
+            height = self.height if i == 0 else (self.height + 1) // 2
+            data = np.frombuffer(plane, np.uint8).reshape(-1, plane.line_size)
+            data = data[:height, :width]
+            if self.flip:
+                data = data[:, ::-1]
+            planes.append(np.ascontiguousarray(data))
+        return planes[0], planes[1], planes[2]
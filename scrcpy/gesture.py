@@ -0,0 +1,218 @@
+"""
+Gesture trajectories computed ahead of time, played on a monotonic clock schedule
+"""
+
+import time
+from typing import Any, List, Tuple
+
+import numpy as np
+
+from .const import (
+    ACTION_DOWN,
+    ACTION_MOVE,
+    ACTION_UP,
+    EASING_IN,
+    EASING_IN_OUT,
+    EASING_LINEAR,
+    EASING_OUT,
+)
+
+# Touch events, input of ControlSender.touch_many
+TOUCH_EVENT_DTYPE = np.dtype(
+    [("x", "i4"), ("y", "i4"), ("action", "u1"), ("touch_id", "i8")]
+)
+
+
+def ease(t: np.ndarray, easing: str = EASING_LINEAR) -> np.ndarray:
+    """
+    Map linear progress to eased progress
+
+    Args:
+        t: progress between 0 and 1
+        easing: EASING_*
+    """
+    if easing == EASING_LINEAR:
+        return t
+    if easing == EASING_IN:
+        return t * t
+    if easing == EASING_OUT:
+        return 1 - (1 - t) * (1 - t)
+    if easing == EASING_IN_OUT:
+        return t * t * (3 - 2 * t)
+    raise ValueError(f"Unknown easing {easing}")
+
+
+def trajectory(
+    start: Tuple[int, int],
+    end: Tuple[int, int],
+    duration: float,
+    interval: float,
+    easing: str = EASING_LINEAR,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sample a straight move from start to end, both axes arrive at the same time
+
+    Args:
+        start: (x, y) of the first point
+        end: (x, y) of the last point
+        duration: seconds from first to last point
+        interval: seconds between two points
+        easing: EASING_*
+
+    Returns:
+        (times in seconds from the first point with shape (n,), int points with shape (n, 2))
+    """
+    assert duration >= 0, "duration must be greater than or equal to 0"
+    assert interval > 0, "interval must be greater than 0"
+
+    steps = max(int(round(duration / interval)), 1)
+    times = np.linspace(0, duration, steps + 1)
+    progress = ease(np.linspace(0, 1, steps + 1), easing)
+    start_point = np.asarray(start, np.float64)
+    end_point = np.asarray(end, np.float64)
+    points = start_point + (end_point - start_point) * progress[:, None]
+    return times, np.rint(points).astype(np.int64)
+
+
+class Track:
+    def __init__(
+        self,
+        times: np.ndarray,
+        points: np.ndarray,
+        touch_id: int = -1,
+        delay: float = 0,
+    ):
+        """
+        Path of one pointer: press at the first point, move through the others, release at the last one
+
+        Args:
+            times: seconds from the press, see trajectory
+            points: (x, y) of each event, see trajectory
+            touch_id: pointer id
+            delay: seconds from the gesture start to the press
+        """
+        assert (
+            len(times) == len(points) > 0
+        ), "times and points must have the same length"
+        assert delay >= 0, "delay must be greater than or equal to 0"
+
+        self.times = np.asarray(times, np.float64)
+        self.points = np.asarray(points)
+        self.touch_id = touch_id
+        self.delay = delay
+
+    @classmethod
+    def tap(
+        cls, x: int, y: int, touch_id: int = -1, hold: float = 0.05, delay: float = 0
+    ) -> "Track":
+        """
+        Press and release at one point
+
+        Args:
+            x: horizontal position
+            y: vertical position
+            touch_id: pointer id
+            hold: seconds between press and release
+            delay: seconds from the gesture start to the press
+        """
+        return cls([0, hold], [(x, y), (x, y)], touch_id, delay)
+
+    @classmethod
+    def swipe(
+        cls,
+        start: Tuple[int, int],
+        end: Tuple[int, int],
+        duration: float,
+        interval: float = 0.005,
+        easing: str = EASING_LINEAR,
+        touch_id: int = -1,
+        delay: float = 0,
+    ) -> "Track":
+        """
+        Straight move, see trajectory
+
+        Args:
+            start: (x, y) of the press
+            end: (x, y) of the release
+            duration: seconds from press to release
+            interval: seconds between two moves
+            easing: EASING_*
+            touch_id: pointer id
+            delay: seconds from the gesture start to the press
+        """
+        times, points = trajectory(start, end, duration, interval, easing)
+        return cls(times, points, touch_id, delay)
+
+    def events(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Touch events of the track
+
+        Returns:
+            (seconds from the gesture start, TOUCH_EVENT_DTYPE events)
+        """
+        count = max(len(self.times), 2)
+        events = np.zeros(count, TOUCH_EVENT_DTYPE)
+        events["action"] = ACTION_MOVE
+        events["action"][0] = ACTION_DOWN
+        events["action"][-1] = ACTION_UP
+        events["touch_id"] = self.touch_id
+        # A single point is pressed and released at once
+        index = np.minimum(np.arange(count), len(self.times) - 1)
+        events["x"] = self.points[index, 0]
+        events["y"] = self.points[index, 1]
+        return self.delay + self.times[index], events
+
+
+def timeline(tracks: List[Track]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge the events of several tracks, sorted by time. Events of one track keep their order
+
+    Args:
+        tracks: tracks to merge
+
+    Returns:
+        (seconds from the gesture start, TOUCH_EVENT_DTYPE events)
+    """
+    parts = [track.events() for track in tracks]
+    times = np.concatenate([part[0] for part in parts])
+    events = np.concatenate([part[1] for part in parts])
+    order = np.argsort(times, kind="stable")
+    return times[order], events[order]
+
+
+def play_tracks(control: Any, tracks: List[Track]) -> None:
+    """
+    Send the events of several tracks on their monotonic clock deadlines.
+    All events due at a time are sent in one write (ControlSender.touch_many), so delays don't accumulate,
+    and events which are late are sent together with the next due ones
+
+    Args:
+        control: ControlSender
+        tracks: tracks to play
+    """
+    times, events = timeline(tracks)
+    start = time.monotonic()
+    i = 0
+    while i < len(times):
+        now = time.monotonic() - start
+        if now < times[i]:
+            time.sleep(times[i] - now)
+            now = max(time.monotonic() - start, times[i])
+        j = int(np.searchsorted(times, now, side="right"))
+        control.touch_many(events[i:j])
+        i = j
+
+
+def play(
+    control: Any, times: np.ndarray, points: np.ndarray, touch_id: int = -1
+) -> None:
+    """
+    Play a single track, see play_tracks
+
+    Args:
+        control: ControlSender
+        times: seconds from the press, see trajectory
+        points: (x, y) of each event, see trajectory
+        touch_id: pointer id
+    """
+    play_tracks(control, [Track(times, points, touch_id)])
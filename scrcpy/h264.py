@@ -0,0 +1,81 @@
+"""
+Helpers to inspect H.264 Annex B bitstreams without decoding them
+"""
+
+from typing import Iterator, Tuple, Union
+
+from .const import (
+    NAL_TYPE_AUD,
+    NAL_TYPE_IDR,
+    NAL_TYPE_SEI,
+    NAL_TYPE_SLICE,
+    NAL_TYPE_SPS,
+)
+
+START_CODE = b"\x00\x00\x01"
+
+
+def iter_nal_headers(
+    data: Union[bytes, bytearray, memoryview],
+) -> Iterator[Tuple[int, int]]:
+    """
+    Yield (nal_ref_idc, nal_unit_type) of every NAL unit in an Annex B buffer
+
+    Args:
+        data: raw h264 bytes, e.g. a packet returned by CodecContext.parse
+    """
+    data = bytes(data)
+    start = data.find(START_CODE)
+    while start != -1 and start + 3 < len(data):
+        header = data[start + 3]
+        yield (header >> 5) & 0x03, header & 0x1F
+        start = data.find(START_CODE, start + 3)
+
+
+def iter_nal_types(data: Union[bytes, bytearray, memoryview]) -> Iterator[int]:
+    """
+    Yield the type of every NAL unit in an Annex B buffer
+
+    Args:
+        data: raw h264 bytes, e.g. a packet returned by CodecContext.parse
+    """
+    for _, nal_type in iter_nal_headers(data):
+        yield nal_type
+
+
+def is_keyframe(data: Union[bytes, bytearray, memoryview]) -> bool:
+    """
+    Check whether a buffer contains an IDR slice, decoding can restart from such a packet
+
+    Args:
+        data: raw h264 bytes
+    """
+    return NAL_TYPE_IDR in iter_nal_types(data)
+
+
+def is_resync_point(data: Union[bytes, bytearray, memoryview]) -> bool:
+    """
+    Check whether decoding can restart from a buffer after packets were lost,
+    i.e. it carries an IDR slice or new parameter sets (SPS)
+
+    Args:
+        data: raw h264 bytes
+    """
+    return any(t in [NAL_TYPE_IDR, NAL_TYPE_SPS] for t in iter_nal_types(data))
+
+
+def is_disposable(data: Union[bytes, bytearray, memoryview]) -> bool:
+    """
+    Check whether a buffer only carries non-reference slices (nal_ref_idc == 0),
+    no later frame depends on it, so the decoder can skip it
+
+    Args:
+        data: raw h264 bytes
+    """
+    has_slice = False
+    for ref_idc, nal_type in iter_nal_headers(data):
+        if nal_type == NAL_TYPE_SLICE and ref_idc == 0:
+            has_slice = True
+        elif nal_type not in [NAL_TYPE_SEI, NAL_TYPE_AUD]:
+            return False
+    return has_slice
@@ -0,0 +1,255 @@
+"""
+Serve many devices from one selector thread and a shared decoder pool
+"""
+
+import os
+import selectors
+import socket
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from .core import Client
+
+
+class DeviceHub:
+    def __init__(self, workers: int = 0, sweep_interval: float = 1):
+        """
+        Read the video sockets of many clients in one selector loop, instead of one stream loop thread
+        per client. Chunks are decoded on a worker pool, each client's chunks in order, one at a time.
+        Control sockets are read by the same loop (read_device_messages), instead of one reader thread per client,
+        so clipboard listeners run on the loop thread and must return quickly.
+
+        Clients served by a hub get frame and init events, but no idle events or None frames.
+
+        Args:
+            workers: number of decoder threads, 0 means os.cpu_count()
+            sweep_interval: seconds between checks for clients stopped from outside, unit is second
+        """
+        assert workers >= 0, "workers must be greater than or equal to 0"
+        assert sweep_interval > 0, "sweep_interval must be greater than 0"
+
+        self.workers = workers or os.cpu_count() or 1
+        self.sweep_interval = sweep_interval
+        self.clients: List[Client] = []
+        # (client, exception) of clients stopped by a decoding error
+        self.errors: List[Tuple[Client, Exception]] = []
+        self.alive = False
+        self.loop_thread: Optional[threading.Thread] = None
+
+        self.__selector = selectors.DefaultSelector()
+        self.__wakeup_reader, self.__wakeup_writer = socket.socketpair()
+        self.__selector.register(self.__wakeup_reader, selectors.EVENT_READ)
+        self.__executor: Optional[ThreadPoolExecutor] = None
+
+        self.__lock = threading.Lock()
+        # Clients to register in (or remove from) the selector, applied by the loop thread
+        self.__added: List[Client] = []
+        self.__removed: List[Client] = []
+        # Chunks waiting for the decoder, and clients with a decoder task running
+        self.__pending: Dict[Client, Deque[bytes]] = {}
+        self.__running: Set[Client] = set()
+
+    def start(self, threaded: bool = False, daemon_threaded: bool = False) -> None:
+        """
+        Start the selector loop
+
+        Args:
+            threaded: Run the loop in a different thread to avoid blocking
+            daemon_threaded: Run the loop in a daemon thread to avoid blocking
+        """
+        assert self.alive is False
+
+        self.alive = True
+        self.__executor = ThreadPoolExecutor(
+            self.workers, thread_name_prefix="scrcpy-decoder"
+        )
+        if threaded or daemon_threaded:
+            self.loop_thread = threading.Thread(
+                target=self.__loop, daemon=daemon_threaded
+            )
+            self.loop_thread.start()
+        else:
+            self.__loop()
+
+    def stop(self) -> None:
+        """
+        Stop the loop and all clients
+        """
+        self.alive = False
+        self.__wakeup()
+        if (
+            self.loop_thread is not None
+            and self.loop_thread is not threading.current_thread()
+        ):
+            self.loop_thread.join()
+        for client in list(self.clients):
+            client.stop()
+        if self.__executor is not None:
+            # Do not wait, stop may be called from a listener running on a decoder thread
+            self.__executor.shutdown(wait=False)
+
+    def add(self, client: Client) -> None:
+        """
+        Connect a client and serve its video socket, do not start the client yourself
+
+        Args:
+            client: client to serve
+        """
+        client.connect(threaded_reader=False)
+        with self.__lock:
+            self.clients.append(client)
+            self.__pending[client] = deque()
+            self.__added.append(client)
+        self.__wakeup()
+
+    def remove(self, client: Client) -> None:
+        """
+        Stop a client and stop serving it
+
+        Args:
+            client: client added before
+        """
+        with self.__lock:
+            if client not in self.clients:
+                return
+            self.__removed.append(client)
+        self.__wakeup()
+
+    def __wakeup(self) -> None:
+        """
+        Interrupt the selector wait
+        """
+        try:
+            self.__wakeup_writer.send(b"\x00")
+        except OSError:
+            pass
+
+    def __loop(self) -> None:
+        """
+        Wait for readable video sockets and queue their data for decoding
+        """
+        while self.alive:
+            self.__apply_changes()
+            for key, _ in self.__selector.select(self.sweep_interval):
+                if key.data is None:
+                    self.__wakeup_reader.recv(0x1000)
+                else:
+                    read, client = key.data
+                    read(client)
+
+    def __apply_changes(self) -> None:
+        """
+        Detach removed or stopped clients, then register added ones.
+        Only the loop thread touches the selector
+        """
+        self.__sweep()
+        with self.__lock:
+            added, self.__added = self.__added, []
+            removed, self.__removed = self.__removed, []
+        for client in removed:
+            self.__detach(client)
+        for client in added:
+            self.__selector.register(
+                client.video_socket, selectors.EVENT_READ, (self.__read, client)
+            )
+            if client.device_message_reader is not None:
+                self.__selector.register(
+                    client.control_socket,
+                    selectors.EVENT_READ,
+                    (self.__read_control, client),
+                )
+
+    def __sweep(self) -> None:
+        """
+        Detach clients stopped from outside the hub, a closed socket never becomes readable
+        """
+        for client in list(self.clients):
+            if not client.alive:
+                self.__detach(client)
+
+    def __detach(self, client: Client) -> None:
+        """
+        Unregister and stop a client
+
+        Args:
+            client: client to detach
+        """
+        for sock in [client.video_socket, client.control_socket]:
+            try:
+                self.__selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+        client.stop()
+        with self.__lock:
+            if client in self.clients:
+                self.clients.remove(client)
+            self.__pending.pop(client, None)
+
+    def __read(self, client: Client) -> None:
+        """
+        Read a readable video socket and schedule decoding
+
+        Args:
+            client: owner of the socket
+        """
+        try:
+            raw_h264 = client.video_socket.recv(0x10000)
+            if not raw_h264:
+                raise ConnectionError("Video socket closed by server")
+        except BlockingIOError:
+            return
+        except OSError:
+            self.__detach(client)
+            return
+
+        with self.__lock:
+            if client not in self.__pending:
+                return
+            self.__pending[client].append(raw_h264)
+            if client in self.__running:
+                return
+            self.__running.add(client)
+        self.__executor.submit(self.__decode, client)
+
+    def __read_control(self, client: Client) -> None:
+        """
+        Read a readable control socket and dispatch device messages
+
+        Args:
+            client: owner of the socket
+        """
+        reader = client.device_message_reader
+        if reader is None:
+            return
+        try:
+            # Readable, so this recv doesn't block although the socket is blocking for senders
+            data = client.control_socket.recv(0x10000)
+            if not data:
+                raise ConnectionError("Control socket closed by server")
+            reader.feed(data)
+        except OSError:  # Socket Closed, or ConnectionError from the parser
+            reader.close()
+            self.__detach(client)
+
+    def __decode(self, client: Client) -> None:
+        """
+        Decoder task, feeds all pending chunks of a client until none is left
+
+        Args:
+            client: client to decode for
+        """
+        while True:
+            with self.__lock:
+                chunks = self.__pending.get(client)
+                if not chunks or not client.alive:
+                    self.__running.discard(client)
+                    return
+                raw_h264 = b"".join(chunks)
+                chunks.clear()
+            try:
+                client.feed(raw_h264)
+            except Exception as e:
+                self.errors.append((client, e))
+                client.stop()
@@ -0,0 +1,184 @@
+"""
+Queues and buffers connecting the stream loop stages and frame consumers
+"""
+
+import threading
+from collections import deque
+from queue import Empty, Full
+from typing import Any, Callable, Deque, Optional, Tuple
+
+from .const import DROP_POLICY_BLOCK, DROP_POLICY_NEWEST, DROP_POLICY_OLDEST
+
+
+class BoundedQueue:
+    def __init__(self, maxsize: int, drop_policy: str = DROP_POLICY_BLOCK):
+        """
+        A thread safe FIFO queue with a fixed capacity, the drop policy decides what happens when it is full
+
+        Args:
+            maxsize: capacity of the queue
+            drop_policy: DROP_POLICY_BLOCK | DROP_POLICY_OLDEST | DROP_POLICY_NEWEST
+        """
+        assert maxsize > 0, "maxsize must be greater than 0"
+        assert drop_policy in [
+            DROP_POLICY_BLOCK,
+            DROP_POLICY_OLDEST,
+            DROP_POLICY_NEWEST,
+        ], "drop_policy must be DROP_POLICY_*"
+
+        self.maxsize = maxsize
+        self.drop_policy = drop_policy
+
+        # Total number of items discarded by the drop policy
+        self.dropped = 0
+
+        self.__items: Deque[Any] = deque()
+        self.__cond = threading.Condition()
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    def put(self, item: Any, timeout: Optional[float] = None) -> None:
+        """
+        Put an item into the queue
+
+        Args:
+            item: item to put
+            timeout: seconds to wait for a free slot, only used by DROP_POLICY_BLOCK
+
+        Raises:
+            Full: no free slot after timeout (DROP_POLICY_BLOCK only)
+        """
+        with self.__cond:
+            if len(self.__items) >= self.maxsize:
+                if self.drop_policy == DROP_POLICY_OLDEST:
+                    self.__items.popleft()
+                    self.dropped += 1
+                elif self.drop_policy == DROP_POLICY_NEWEST:
+                    self.dropped += 1
+                    return
+                elif not self.__cond.wait_for(
+                    lambda: len(self.__items) < self.maxsize, timeout
+                ):
+                    raise Full
+            self.__items.append(item)
+            self.__cond.notify_all()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        Remove and return the oldest item
+
+        Args:
+            timeout: seconds to wait for an item, None means wait forever
+
+        Raises:
+            Empty: no item after timeout
+        """
+        with self.__cond:
+            if not self.__cond.wait_for(lambda: len(self.__items) > 0, timeout):
+                raise Empty
+            item = self.__items.popleft()
+            self.__cond.notify_all()
+            return item
+
+
+class LatestFrame:
+    def __init__(self, convert: Callable[[Any], Any]):
+        """
+        A single slot buffer keeping the newest frame only, older frames are overwritten.
+        Frames are stored as decoded and converted on first read, so frames nobody reads are never converted.
+
+        Args:
+            convert: function converting a stored frame into the returned one
+        """
+        self.convert = convert
+
+        # Sequence number of the newest frame, 0 means no frame yet
+        self.seq = 0
+        # Closed slots wake up waiting consumers, see close
+        self.closed = False
+
+        self.__frame: Any = None
+        self.__converted: Any = None
+        self.__converted_seq = 0
+        self.__cond = threading.Condition()
+        self.__convert_lock = threading.Lock()
+
+    def publish(self, frame: Any) -> int:
+        """
+        Replace the stored frame and wake up waiting consumers
+
+        Args:
+            frame: decoded frame
+
+        Returns:
+            sequence number of the frame
+        """
+        with self.__cond:
+            self.seq += 1
+            self.__frame = frame
+            self.__cond.notify_all()
+            return self.seq
+
+    def open(self) -> None:
+        """
+        Accept waiting consumers again after close
+        """
+        with self.__cond:
+            self.closed = False
+
+    def close(self) -> None:
+        """
+        Wake up all waiting consumers, waits without a newer frame raise ConnectionError until open
+        """
+        with self.__cond:
+            self.closed = True
+            self.__cond.notify_all()
+
+    def get(self) -> Tuple[int, Any]:
+        """
+        Get the newest frame without waiting
+
+        Returns:
+            (sequence number, converted frame), (0, None) if no frame yet
+        """
+        with self.__cond:
+            seq, frame = self.seq, self.__frame
+        return seq, self.__convert(seq, frame)
+
+    def wait(self, seq: int = 0, timeout: Optional[float] = None) -> Tuple[int, Any]:
+        """
+        Wait for a frame newer than seq
+
+        Args:
+            seq: sequence number of the last frame the consumer has seen
+            timeout: seconds to wait, None means wait forever
+
+        Returns:
+            (sequence number, converted frame), the sequence number is unchanged on timeout
+
+        Raises:
+            ConnectionError: the slot is closed and has no frame newer than seq
+        """
+        with self.__cond:
+            self.__cond.wait_for(lambda: self.seq > seq or self.closed, timeout)
+            if self.seq <= seq and self.closed:
+                raise ConnectionError("Frame source is closed")
+            seq, frame = self.seq, self.__frame
+        return seq, self.__convert(seq, frame)
+
+    def __convert(self, seq: int, frame: Any) -> Any:
+        """
+        Convert a frame once, concurrent readers of the same frame share the result
+
+        Args:
+            seq: sequence number of the frame
+            frame: stored frame
+        """
+        if frame is None:
+            return None
+        with self.__convert_lock:
+            if self.__converted_seq != seq:
+                self.__converted = self.convert(frame)
+                self.__converted_seq = seq
+            return self.__converted
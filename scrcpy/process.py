@@ -0,0 +1,238 @@
+"""
+Decode in a worker process, frames come back through shared memory
+"""
+
+import multiprocessing
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+import numpy as np
+from av.error import InvalidDataError
+
+from . import h264
+from .const import DECODER_THREAD_SLICE
+from .decoder import create_codec
+from .frame import Frame
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.7
+    shared_memory = None
+
+
+def decoder_main(conn: Any, options: Dict[str, Any]) -> None:
+    """
+    Worker process entry, decodes raw h264 received from conn into a shared memory ring of bgr frames.
+
+    Messages received: ("data", raw h264), ("release", generation, slot), None to exit.
+    Messages sent: ("ring", generation, shared memory name, slot size), ("frame", generation, slot, width, height).
+    A slot is not written again until the parent released it, frames are dropped while no slot is free.
+
+    Args:
+        conn: duplex pipe to the parent
+        options: DecoderProcess settings
+    """
+    codec = create_codec(
+        options["threads"], options["thread_type"], options["resolution"]
+    )
+    ring_size = options["ring_size"]
+    ring = None
+    slot_size = 0
+    generation = 0
+    free: Deque[int] = deque()
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            if message[0] == "release":
+                if message[1] == generation:
+                    free.append(message[2])
+                continue
+
+            try:
+                packets = codec.parse(message[1])
+            except InvalidDataError:
+                continue
+            for packet in packets:
+                if options["keyframes_only"] and not h264.is_resync_point(packet):
+                    continue
+                try:
+                    frames = codec.decode(packet)
+                except InvalidDataError:
+                    continue
+                for frame in frames:
+                    width, height = frame.width, frame.height
+                    if ring is None or width * height * 3 > slot_size:
+                        # Grow the ring, the parent keeps its mapping of the old one
+                        if ring is not None:
+                            ring.close()
+                            ring.unlink()
+                        slot_size = width * height * 3
+                        ring = shared_memory.SharedMemory(
+                            create=True, size=slot_size * ring_size
+                        )
+                        generation += 1
+                        free = deque(range(ring_size))
+                        conn.send(("ring", generation, ring.name, slot_size))
+                    if not free:
+                        continue
+
+                    slot = free.popleft()
+                    target = np.ndarray(
+                        (height, width, 3), np.uint8, ring.buf, slot * slot_size
+                    )
+                    np.copyto(target, Frame(frame, options["flip"]).bgr)
+                    del target
+                    conn.send(("frame", generation, slot, width, height))
+    except (EOFError, OSError):  # Parent is gone
+        pass
+    finally:
+        if ring is not None:
+            ring.close()
+            ring.unlink()
+
+
+class DecoderProcess:
+    def __init__(
+        self,
+        on_frame: Callable[[np.ndarray], None],
+        flip: bool = False,
+        keyframes_only: bool = False,
+        threads: int = 1,
+        thread_type: str = DECODER_THREAD_SLICE,
+        resolution: Optional[Tuple[int, int]] = None,
+        ring_size: int = 4,
+    ):
+        """
+        Decode and convert frames in a worker process, only small messages cross the pipe,
+        bgr frames are handed over through a multiprocessing.shared_memory ring.
+
+        Frames passed to on_frame are borrowed views into the ring,
+        they are overwritten once ring_size newer frames were delivered, copy them to keep them longer.
+
+        Args:
+            on_frame: called with each bgr frame, from the receiver thread
+            flip: flip the frames horizontally
+            keyframes_only: drop every packet but keyframes and parameter sets before decoding
+            threads: decoder thread count in the worker, see create_codec
+            thread_type: DECODER_THREAD_*
+            resolution: stream resolution, used by threads=0
+            ring_size: number of frames in the shared memory ring
+        """
+        assert shared_memory is not None, "DecoderProcess requires Python 3.8+"
+        assert ring_size > 1, "ring_size must be greater than 1"
+
+        self.on_frame = on_frame
+        self.options = dict(
+            flip=flip,
+            keyframes_only=keyframes_only,
+            threads=threads,
+            thread_type=thread_type,
+            resolution=resolution,
+            ring_size=ring_size,
+        )
+        self.process: Optional[multiprocessing.process.BaseProcess] = None
+        self.receiver_thread: Optional[threading.Thread] = None
+
+        self.__conn: Any = None
+        self.__send_lock = threading.Lock()
+        # Attached rings by generation, older ones stay mapped while frames are referenced
+        self.__rings: Dict[int, Any] = {}
+
+    def start(self) -> None:
+        """
+        Spawn the worker process and the receiver thread
+        """
+        context = multiprocessing.get_context("spawn")
+        self.__conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=decoder_main, args=(child_conn, self.options), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+        self.receiver_thread = threading.Thread(target=self.__receive_loop, daemon=True)
+        self.receiver_thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the worker process, unmap the rings
+        """
+        if self.process is None:
+            return
+        try:
+            self.__send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+        if self.receiver_thread is not threading.current_thread():
+            self.receiver_thread.join()
+        self.__conn.close()
+        for generation in list(self.__rings):
+            self.__close_ring(generation)
+
+    def feed(self, raw_h264: bytes) -> None:
+        """
+        Send a chunk read from the video socket to the worker
+
+        Args:
+            raw_h264: raw h264 bytes
+        """
+        self.__send(("data", raw_h264))
+
+    def __send(self, message: Any) -> None:
+        """
+        Send a message to the worker, feed and release run on different threads
+
+        Args:
+            message: picklable message
+        """
+        with self.__send_lock:
+            self.__conn.send(message)
+
+    def __receive_loop(self) -> None:
+        """
+        Map frames announced by the worker and hand them to on_frame
+        """
+        while True:
+            try:
+                message = self.__conn.recv()
+            except (EOFError, OSError):
+                return
+            if message[0] == "ring":
+                _, generation, name, slot_size = message
+                self.__rings[generation] = (
+                    shared_memory.SharedMemory(name=name),
+                    slot_size,
+                )
+                for old in [g for g in self.__rings if g < generation]:
+                    self.__close_ring(old)
+                continue
+
+            _, generation, slot, width, height = message
+            ring, slot_size = self.__rings[generation]
+            self.on_frame(
+                np.ndarray((height, width, 3), np.uint8, ring.buf, slot * slot_size)
+            )
+            try:
+                self.__send(("release", generation, slot))
+            except OSError:
+                return
+
+    def __close_ring(self, generation: int) -> None:
+        """
+        Unmap a ring, unless frames in it are still referenced
+
+        Args:
+            generation: ring generation
+        """
+        ring, _ = self.__rings[generation]
+        try:
+            ring.close()
+        except BufferError:
+            return
+        del self.__rings[generation]
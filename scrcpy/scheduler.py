@@ -0,0 +1,83 @@
+"""
+A timer thread running delayed calls, shared by all clients
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class Scheduler:
+    def __init__(self):
+        """
+        Run calls at monotonic clock deadlines on one daemon thread, started on first use.
+        Calls should be short (e.g. send a control message), a slow call delays the next ones
+        """
+        self.__heap: List[Tuple[float, int, Callable[[], Any], Future]] = []
+        # Tie breaker, calls with the same deadline run in submission order
+        self.__counter = itertools.count()
+        self.__cond = threading.Condition()
+        self.__thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self.__heap)
+
+    def call_at(self, deadline: float, fn: Callable[[], Any]) -> Future:
+        """
+        Run fn at a deadline
+
+        Args:
+            deadline: time.monotonic() value
+            fn: function without arguments
+
+        Returns:
+            Future resolved with the result of fn, cancel it to skip the call
+        """
+        future: Future = Future()
+        with self.__cond:
+            heapq.heappush(self.__heap, (deadline, next(self.__counter), fn, future))
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__loop, daemon=True)
+                self.__thread.start()
+            self.__cond.notify()
+        return future
+
+    def call_later(self, delay: float, fn: Callable[[], Any]) -> Future:
+        """
+        Run fn after a delay
+
+        Args:
+            delay: seconds to wait
+            fn: function without arguments
+
+        Returns:
+            Future resolved with the result of fn, cancel it to skip the call
+        """
+        return self.call_at(time.monotonic() + delay, fn)
+
+    def __loop(self) -> None:
+        """
+        Wait for the earliest deadline and run its call
+        """
+        while True:
+            with self.__cond:
+                while not self.__heap or self.__heap[0][0] > time.monotonic():
+                    timeout = (
+                        self.__heap[0][0] - time.monotonic() if self.__heap else None
+                    )
+                    self.__cond.wait(timeout)
+                _, _, fn, future = heapq.heappop(self.__heap)
+
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn())
+            except Exception as e:
+                future.set_exception(e)
+
+
+# Shared by all ControlSenders
+default_scheduler = Scheduler()
@@ -0,0 +1,692 @@
+"""
+Template images matched against frames, decoded from disk once and kept in memory
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+# Methods where the best match is the highest score
+MATCH_METHODS = [cv2.TM_CCOEFF_NORMED, cv2.TM_CCORR_NORMED]
+# Smallest side of a template in a coarse pyramid level, smaller ones are matched at a finer level
+PYRAMID_MIN_SIZE = 8
+
+
+class Match(NamedTuple):
+    """
+    Result of TemplateMatcher.match
+    """
+
+    found: bool
+    # Center of the best match in frame coordinates, None if the template doesn't fit in the frame
+    location: Optional[Tuple[float, float]]
+    score: float
+
+
+class TemplateStats(NamedTuple):
+    """
+    Counters of one template, see TemplateRegistry.stats
+    """
+
+    loads: int
+    matches: int
+    hits: int
+    seconds: float
+    last_score: float
+    # Matches found in the region of interest, without a full frame search
+    roi_hits: int
+    # Template scale of the last match, see TemplateMatcher scales
+    last_scale: float
+
+
+EMPTY_STATS = TemplateStats(0, 0, 0, 0, 0, 0, 1)
+
+
+class Template:
+    def __init__(self, name: str, path: str, image: np.ndarray, mtime: float):
+        """
+        A template image, already converted and scaled by its registry
+
+        Args:
+            name: file name without extension
+            path: file path
+            image: converted image
+            mtime: modification time of the file when it was loaded
+        """
+        self.name = name
+        self.path = path
+        self.image = image
+        self.mtime = mtime
+        self.height, self.width = image.shape[:2]
+        self.checked_at = time.monotonic()
+
+        self.__resized: Dict[Tuple[float, int], np.ndarray] = {(1, 0): image}
+
+    def resized(self, scale: float, level: int = 0) -> np.ndarray:
+        """
+        Image resized once and cached
+
+        Args:
+            scale: resize factor
+            level: pyramid level, each level halves the size again
+        """
+        key = (scale, level)
+        image = self.__resized.get(key)
+        if image is None:
+            factor = scale / 2**level
+            image = cv2.resize(
+                self.image, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA
+            )
+            self.__resized[key] = image
+        return image
+
+
+class TemplateRegistry:
+    def __init__(
+        self,
+        directory: str,
+        grayscale: bool = False,
+        scale: float = 1,
+        capacity: int = 64,
+        check_interval: float = 1,
+        extension: str = ".png",
+    ):
+        """
+        Load template files on first use and keep them in memory, least recently used ones are evicted.
+        A file changed on disk is loaded again, its modification time is checked at most once per check_interval.
+        Frames must be passed through prepare before matching, so they get the same conversion as the templates
+
+        Args:
+            directory: directory of the template files
+            grayscale: keep templates in grayscale, matching is several times cheaper
+            scale: resize factor of templates and frames, e.g. 0.5 matches 4x fewer pixels
+            capacity: maximum number of templates in memory
+            check_interval: seconds between two modification checks of a file, 0 checks on every use
+            extension: extension of the template files
+        """
+        assert scale > 0, "scale must be greater than 0"
+        assert capacity > 0, "capacity must be greater than 0"
+        assert check_interval >= 0, "check_interval must be greater than or equal to 0"
+
+        self.directory = directory
+        self.grayscale = grayscale
+        self.scale = scale
+        self.capacity = capacity
+        self.check_interval = check_interval
+        self.extension = extension
+
+        self.__templates: "OrderedDict[str, Template]" = OrderedDict()
+        # Kept apart from the templates, counters and regions survive eviction and reload
+        self.__stats: Dict[str, TemplateStats] = {}
+        self.__rois: Dict[str, Tuple[float, float, float, float]] = {}
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__templates)
+
+    def names(self) -> List[str]:
+        """
+        Names of the template files in the directory
+        """
+        return sorted(
+            os.path.splitext(file)[0]
+            for file in os.listdir(self.directory)
+            if file.endswith(self.extension)
+        )
+
+    def preload(self) -> None:
+        """
+        Load the templates of the directory, up to capacity
+        """
+        for name in self.names()[: self.capacity]:
+            self.get(name)
+
+    def get(self, name: str) -> Template:
+        """
+        Get a template, loading it if it is not in memory or its file changed
+
+        Args:
+            name: file name without extension
+
+        Raises:
+            FileNotFoundError: the file doesn't exist or isn't an image
+        """
+        with self.__lock:
+            template = self.__templates.get(name)
+            if template is not None:
+                self.__templates.move_to_end(name)
+                if time.monotonic() - template.checked_at < self.check_interval:
+                    return template
+                template.checked_at = time.monotonic()
+                if self.__mtime(template.path) == template.mtime:
+                    return template
+
+            template = self.__load(name)
+            self.__templates[name] = template
+            self.__templates.move_to_end(name)
+            while len(self.__templates) > self.capacity:
+                self.__templates.popitem(last=False)
+            return template
+
+    def prepare(self, image: np.ndarray) -> np.ndarray:
+        """
+        Convert a bgr image like the templates
+
+        Args:
+            image: bgr image, e.g. a frame
+        """
+        if self.grayscale and image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if self.scale != 1:
+            image = cv2.resize(
+                image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA
+            )
+        return image
+
+    def record(
+        self,
+        name: str,
+        hit: bool,
+        score: float,
+        seconds: float,
+        roi_hit: bool = False,
+        scale: float = 1,
+    ) -> None:
+        """
+        Count a match of a template
+
+        Args:
+            name: template name
+            hit: whether the template was found
+            score: best score
+            seconds: matching time
+            roi_hit: whether it was found in the region of interest
+            scale: template scale of the best score
+        """
+        with self.__lock:
+            stats = self.__stats.get(name, EMPTY_STATS)
+            self.__stats[name] = stats._replace(
+                matches=stats.matches + 1,
+                hits=stats.hits + hit,
+                seconds=stats.seconds + seconds,
+                last_score=score,
+                roi_hits=stats.roi_hits + roi_hit,
+                last_scale=scale,
+            )
+
+    def roi(self, name: str) -> Optional[Tuple[float, float, float, float]]:
+        """
+        Region of interest of a template, None if unknown
+
+        Args:
+            name: template name
+
+        Returns:
+            (left, top, right, bottom), fractions of the frame width and height
+        """
+        return self.__rois.get(name)
+
+    def set_roi(
+        self, name: str, roi: Optional[Tuple[float, float, float, float]]
+    ) -> None:
+        """
+        Set the region of interest of a template, e.g. saved from rois() of a previous run
+
+        Args:
+            name: template name
+            roi: (left, top, right, bottom), fractions of the frame width and height, None to forget it
+        """
+        with self.__lock:
+            if roi is None:
+                self.__rois.pop(name, None)
+            else:
+                self.__rois[name] = roi
+
+    def extend_roi(self, name: str, box: Tuple[float, float, float, float]) -> None:
+        """
+        Grow the region of interest of a template to include a box
+
+        Args:
+            name: template name
+            box: (left, top, right, bottom), fractions of the frame width and height
+        """
+        with self.__lock:
+            roi = self.__rois.get(name)
+            if roi is not None:
+                box = (
+                    min(roi[0], box[0]),
+                    min(roi[1], box[1]),
+                    max(roi[2], box[2]),
+                    max(roi[3], box[3]),
+                )
+            self.__rois[name] = box
+
+    def rois(self) -> Dict[str, Tuple[float, float, float, float]]:
+        """
+        Regions of interest of every template, by name
+        """
+        with self.__lock:
+            return dict(self.__rois)
+
+    def stats(self) -> Dict[str, TemplateStats]:
+        """
+        Counters of every template used so far, by name
+        """
+        with self.__lock:
+            return dict(self.__stats)
+
+    def __load(self, name: str) -> Template:
+        """
+        Read and convert a template file, call with the lock held
+
+        Args:
+            name: file name without extension
+        """
+        path = os.path.join(self.directory, name + self.extension)
+        mtime = self.__mtime(path)
+        image = cv2.imread(path)
+        if image is None:
+            raise FileNotFoundError(f"Template {path} can't be read")
+
+        stats = self.__stats.get(name, EMPTY_STATS)
+        self.__stats[name] = stats._replace(loads=stats.loads + 1)
+        return Template(name, path, self.prepare(image), mtime)
+
+    @staticmethod
+    def __mtime(path: str) -> Optional[float]:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+
+class TemplateMatcher:
+    def __init__(
+        self,
+        registry: TemplateRegistry,
+        threshold: float = 0.8,
+        method: int = cv2.TM_CCOEFF_NORMED,
+        learn_roi: bool = True,
+        roi_margin: float = 0.05,
+        fallback: bool = True,
+        workers: int = 0,
+        pyramid_levels: int = 0,
+        candidates: int = 3,
+        scales: Sequence[float] = (1,),
+        cache_frames: int = 4,
+    ):
+        """
+        Find templates of a registry in frames.
+
+        A template with a region of interest is searched in that region first, the region is learned
+        from the locations where the template was found. Templates are then found at a fraction of the cost,
+        but a miss still costs a full frame search unless fallback is disabled.
+
+        With pyramid_levels, templates are first searched in a frame downscaled by 2 ** pyramid_levels,
+        then only around the best candidates at full size. With several scales, templates are resized by each
+        of them and the best score wins, e.g. for templates captured at another max_width.
+
+        Calls given a frame_id share their work: the converted frame and the match of each template are computed
+        once per frame, by the first caller, while concurrent callers wait for it. Results of the cache_frames
+        most recent frame ids are kept, so threads looking at neighbouring frames don't drop each other's results
+
+        Args:
+            registry: templates to match
+            threshold: minimum score of a match
+            method: cv2.TM_CCOEFF_NORMED or cv2.TM_CCORR_NORMED
+            learn_roi: grow the region of interest of a template where it is found
+            roi_margin: margin around regions of interest, fraction of the frame size
+            fallback: search the full frame when the template is not found in its region
+            workers: number of match_all threads, 0 means os.cpu_count()
+            pyramid_levels: number of halvings of the coarse search, 0 searches at full size only
+            candidates: number of coarse peaks refined at full size
+            scales: template resize factors to try
+            cache_frames: number of recent frame ids with cached results
+        """
+        assert method in MATCH_METHODS, "method must be a normed correlation method"
+        assert roi_margin >= 0, "roi_margin must be greater than or equal to 0"
+        assert workers >= 0, "workers must be greater than or equal to 0"
+        assert pyramid_levels >= 0, "pyramid_levels must be greater than or equal to 0"
+        assert candidates > 0, "candidates must be greater than 0"
+        assert len(scales) > 0 and min(scales) > 0, "scales must be greater than 0"
+        assert cache_frames > 0, "cache_frames must be greater than 0"
+
+        self.registry = registry
+        self.threshold = threshold
+        self.method = method
+        self.learn_roi = learn_roi
+        self.roi_margin = roi_margin
+        self.fallback = fallback
+        self.workers = workers or os.cpu_count() or 1
+        self.pyramid_levels = pyramid_levels
+        self.candidates = candidates
+        self.scales = tuple(scales)
+        self.cache_frames = cache_frames
+
+        # Calls answered from the frame cache, and calls which computed their result
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__executor_lock = threading.Lock()
+        self.__cache_lock = threading.Lock()
+        # Results by frame id, then by what was computed
+        self.__cache: Dict[int, Dict[Tuple[Any, ...], Future]] = {}
+
+    def close(self) -> None:
+        """
+        Stop the match_all threads, they are started again on the next call
+        """
+        with self.__executor_lock:
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def match_all(
+        self, frame: np.ndarray, names: List[str], frame_id: Optional[int] = None
+    ) -> Dict[str, Match]:
+        """
+        Find several templates in a frame. The frame is converted and its pyramid built once for all templates,
+        which are searched in parallel, cv2 releases the GIL while matching
+
+        Args:
+            frame: bgr frame
+            names: template names
+            frame_id: increasing id of the frame, e.g. the sequence number of Client.wait_frame, None disables the cache
+
+        Returns:
+            Match of every name, in the order of names
+        """
+        pyramid = self.__frame_pyramid(frame, frame_id)
+        templates = [self.registry.get(name) for name in names]
+        if self.workers == 1 or len(templates) < 2:
+            matches = [
+                self.__cached_match(pyramid, template, frame_id)
+                for template in templates
+            ]
+        else:
+            matches = list(
+                self.__pool().map(
+                    lambda t: self.__cached_match(pyramid, t, frame_id), templates
+                )
+            )
+        return dict(zip(names, matches))
+
+    def match(
+        self, frame: np.ndarray, name: str, frame_id: Optional[int] = None
+    ) -> Match:
+        """
+        Find the best location of a template in a frame
+
+        Args:
+            frame: bgr frame
+            name: template name
+            frame_id: increasing id of the frame, e.g. the sequence number of Client.wait_frame, None disables the cache
+        """
+        template = self.registry.get(name)
+        pyramid = self.__frame_pyramid(frame, frame_id)
+        return self.__cached_match(pyramid, template, frame_id)
+
+    def __frame_pyramid(
+        self, frame: np.ndarray, frame_id: Optional[int]
+    ) -> List[np.ndarray]:
+        """
+        Pyramid of the converted frame, see match
+        """
+        return self.__cached(
+            frame_id,
+            ("pyramid",),
+            lambda: self.__pyramid(self.registry.prepare(frame)),
+        )
+
+    def __cached_match(
+        self, pyramid: List[np.ndarray], template: Template, frame_id: Optional[int]
+    ) -> Match:
+        """
+        Match of a template, see match
+        """
+        return self.__cached(
+            frame_id,
+            ("match", template.name, self.method),
+            lambda: self.__match(pyramid, template),
+        )
+
+    def __cached(
+        self, frame_id: Optional[int], key: Tuple[Any, ...], compute: Callable[[], Any]
+    ) -> Any:
+        """
+        Result of compute for the frame, computed by the first caller only.
+        Frames older than every kept one are not cached, the cache never goes back in time
+
+        Args:
+            frame_id: increasing id of the frame, None to always compute
+            key: what is computed
+            compute: function without arguments
+        """
+        if frame_id is None:
+            return compute()
+
+        with self.__cache_lock:
+            cache = self.__frame_cache(frame_id)
+            future = None if cache is None else cache.get(key)
+            owner = future is None
+            if owner:
+                self.cache_misses += 1
+                if cache is None:
+                    future = Future()
+                else:
+                    future = cache[key] = Future()
+            else:
+                self.cache_hits += 1
+
+        if owner:
+            try:
+                future.set_result(compute())
+            except Exception as e:
+                # Computed again by the next caller
+                with self.__cache_lock:
+                    if cache is not None and cache.get(key) is future:
+                        del cache[key]
+                future.set_exception(e)
+        return future.result()
+
+    def __frame_cache(self, frame_id: int) -> Optional[Dict[Tuple[Any, ...], Future]]:
+        """
+        Results of a frame, call with the cache lock held.
+        None if the frame is older than every kept one, the oldest frame is dropped to make room for a newer one
+        """
+        cache = self.__cache.get(frame_id)
+        if cache is not None:
+            return cache
+        if len(self.__cache) >= self.cache_frames:
+            oldest = min(self.__cache)
+            if frame_id < oldest:
+                return None
+            del self.__cache[oldest]
+        cache = self.__cache[frame_id] = {}
+        return cache
+
+    def __match(self, pyramid: List[np.ndarray], template: Template) -> Match:
+        """
+        Find a template in the pyramid of a frame converted by the registry
+        """
+        name = template.name
+        start = time.perf_counter()
+        height, width = pyramid[0].shape[:2]
+
+        roi = self.registry.roi(name)
+        if roi is not None:
+            bounds = self.__crop(roi, width, height, template)
+            best = self.__find(pyramid, template, bounds)
+            if best is not None and (best[0] > self.threshold or not self.fallback):
+                score, x, y, w, h, scale = best
+                found = score > self.threshold
+                self.registry.record(
+                    name, found, score, time.perf_counter() - start, found, scale
+                )
+                return self.__result(found, x, y, w, h, score)
+
+        best = self.__find(pyramid, template, (0, 0, width, height))
+        if best is None:
+            return Match(False, None, 0)
+        score, x, y, w, h, scale = best
+        found = score > self.threshold
+        if found and self.learn_roi:
+            self.registry.extend_roi(
+                name, (x / width, y / height, (x + w) / width, (y + h) / height)
+            )
+        self.registry.record(
+            name, found, score, time.perf_counter() - start, scale=scale
+        )
+        return self.__result(found, x, y, w, h, score)
+
+    def __find(
+        self,
+        pyramid: List[np.ndarray],
+        template: Template,
+        bounds: Tuple[int, int, int, int],
+    ) -> Optional[Tuple[float, int, int, int, int, float]]:
+        """
+        Best match of a template inside bounds, over all scales
+
+        Returns:
+            (score, left, top, width, height, scale), None if the template is larger than bounds at every scale
+        """
+        left, top, right, bottom = bounds
+        best = None
+        for scale in self.scales:
+            image = template.resized(scale)
+            h, w = image.shape[:2]
+            if h > bottom - top or w > right - left:
+                continue
+            for window in self.__windows(pyramid, template, scale, bounds):
+                window_left, window_top, window_right, window_bottom = window
+                score, (x, y) = self.__search(
+                    pyramid[0][window_top:window_bottom, window_left:window_right],
+                    image,
+                )
+                if best is None or score > best[0]:
+                    best = (score, x + window_left, y + window_top, w, h, scale)
+        return best
+
+    def __windows(
+        self,
+        pyramid: List[np.ndarray],
+        template: Template,
+        scale: float,
+        bounds: Tuple[int, int, int, int],
+    ) -> List[Tuple[int, int, int, int]]:
+        """
+        Full size windows around the coarse peaks of a template, bounds itself without a usable coarse level
+        """
+        left, top, right, bottom = bounds
+        h, w = template.resized(scale).shape[:2]
+        level = min(
+            len(pyramid) - 1, int(np.log2(max(min(h, w), 1) / PYRAMID_MIN_SIZE))
+        )
+        if level <= 0:
+            return [bounds]
+
+        factor = 2**level
+        coarse = pyramid[level][
+            top // factor : bottom // factor, left // factor : right // factor
+        ]
+        small = template.resized(scale, level)
+        if small.shape[0] > coarse.shape[0] or small.shape[1] > coarse.shape[1]:
+            return [bounds]
+
+        result = cv2.matchTemplate(coarse, small, self.method)
+        small_h, small_w = small.shape[:2]
+        windows = []
+        for _ in range(self.candidates):
+            _, score, _, (x, y) = cv2.minMaxLoc(result)
+            if score <= -1:  # Every peak suppressed
+                break
+            # Suppress the peak and its neighbours
+            result[
+                max(y - small_h // 2, 0) : y + small_h // 2 + 1,
+                max(x - small_w // 2, 0) : x + small_w // 2 + 1,
+            ] = -1
+            # Coarse positions are off by up to a factor of pixels
+            x, y = left + x * factor, top + y * factor
+            pad = 2 * factor
+            windows.append(
+                (
+                    max(x - pad, left),
+                    max(y - pad, top),
+                    min(x + w + pad, right),
+                    min(y + h + pad, bottom),
+                )
+            )
+        return windows
+
+    def __pyramid(self, image: np.ndarray) -> List[np.ndarray]:
+        """
+        Image followed by its halvings, up to pyramid_levels
+        """
+        pyramid = [image]
+        for _ in range(self.pyramid_levels):
+            if min(pyramid[-1].shape[:2]) < 2 * PYRAMID_MIN_SIZE:
+                break
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        return pyramid
+
+    def __pool(self) -> ThreadPoolExecutor:
+        """
+        Executor of match_all, created on first use
+        """
+        with self.__executor_lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="scrcpy-matcher"
+                )
+            return self.__executor
+
+    def __search(
+        self, image: np.ndarray, template: np.ndarray
+    ) -> Tuple[float, Tuple[int, int]]:
+        """
+        Best score and its top left corner
+        """
+        result = cv2.matchTemplate(image, template, self.method)
+        _, score, _, location = cv2.minMaxLoc(result)
+        return score, location
+
+    def __crop(
+        self,
+        roi: Tuple[float, float, float, float],
+        width: int,
+        height: int,
+        template: Template,
+    ) -> Tuple[int, int, int, int]:
+        """
+        Pixel bounds of a region of interest with its margin, at least as large as the template at any scale
+        """
+        template_w = min(int(np.ceil(template.width * max(self.scales))), width)
+        template_h = min(int(np.ceil(template.height * max(self.scales))), height)
+        margin_x, margin_y = self.roi_margin * width, self.roi_margin * height
+        left = max(int(roi[0] * width - margin_x), 0)
+        top = max(int(roi[1] * height - margin_y), 0)
+        right = max(int(np.ceil(roi[2] * width + margin_x)), left + template_w)
+        bottom = max(int(np.ceil(roi[3] * height + margin_y)), top + template_h)
+        # Shift back inside the frame
+        if right > width:
+            left, right = max(left - (right - width), 0), width
+        if bottom > height:
+            top, bottom = max(top - (bottom - height), 0), height
+        return left, top, right, bottom
+
+    def __result(
+        self, found: bool, x: int, y: int, w: int, h: int, score: float
+    ) -> Match:
+        """
+        Match centered on the template, in frame coordinates
+        """
+        scale = self.registry.scale
+        return Match(found, ((x + w / 2) / scale, (y + h / 2) / scale), score)
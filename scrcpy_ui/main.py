@@ -11,7 +11,6 @@ from threading import Thread
 import time
 from time import sleep
 from ui_main import Ui_MainWindow
-import queue
 import logging
 import sys
 
@@ -28,13 +27,11 @@ class MainWindow(QMainWindow):
         max_width: Optional[int],
         serial: Optional[str] = None,
         encoder_name: Optional[str] = None,
-        frame_queue: Optional[queue.Queue] = None,
     ):
         super(MainWindow, self).__init__()
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
         self.max_width = max_width        
-        self.frame_queue = frame_queue
         self.stop = False
         self.mouse_touch_id=-2
         self.screen_status = True
@@ -55,6 +52,9 @@ class MainWindow(QMainWindow):
             bitrate=8000000,
             encoder_name=encoder_name,
             # max_fps=10,
+            delivery=scrcpy.DELIVERY_LATEST,
+            batch_control=True,
+            coalesce_moves=True,
         )
         self.client.add_listener(scrcpy.EVENT_INIT, self.on_init)
         self.client.add_listener(scrcpy.EVENT_FRAME, self.on_frame)
@@ -191,8 +191,6 @@ class MainWindow(QMainWindow):
     def on_frame(self, frame):
         app.processEvents()
         if frame is not None:
-            #     self.frame_queue.queue.clear()
-            self.frame_queue.put(frame,block=False)
             if(self.take_screenshot_request):                
                 time_string=time.strftime("%Y%m%d_%H%M%S",time.gmtime())
                 # file_name = 'D:\\Projects\\Python\\my-py-scrcpy-client\\scrcpy_ui\\simulator\\screenshot\\'+time_string+'.png'
@@ -228,13 +226,17 @@ class AutoBattle():
 
         self.in_battle = False
         self.parent_path = parent_path
-        self.frame_queue = main_window.frame_queue
         self.client = main_window.client
         self.threshold = 0.8
         self.current_frame = None
+        # (seq, frame) of the latest frame, the seq lets detector threads share match results of a frame
+        self.current = (0, None)
         self.main_window = main_window
         self.meet_enemy = False
         self.thread_sleep = False
+        # templates are decoded once and shared by all detector threads
+        self.templates = scrcpy.TemplateRegistry(parent_path)
+        self.matcher = scrcpy.TemplateMatcher(self.templates, self.threshold, pyramid_levels=2)
 
     def tap(self,x,y,touch_id=-2):
         """
@@ -243,40 +245,62 @@ class AutoBattle():
         x:x
         y:y
         touch_id: Default using virtual id -1, you can specify it to emulate multi finger touch
+        returns: future resolved once the finger is released, the caller is not blocked
         """
 
-        self.client.control.touch(x,y,scrcpy.ACTION_DOWN,touch_id)
-        sleep(0.1)
-        self.client.control.touch(x,y,scrcpy.ACTION_UP,touch_id)
         logger.info('tap x:%s y:%s touch_id:%s',x,y,touch_id)
+        return self.client.control.tap(x,y,0.1,touch_id)
 
-    def match_latest_frame(self,frame,file_ab_path):
+    def frame_id(self,frame):
+        """
+        seq of the frame if it is the latest one, None otherwise (not cached)
+        """
+        seq, latest = self.current
+        return seq if frame is latest else None
+
+    def match_latest_frame(self,frame,name):
         """
         match the template image with current frame, if match , return the match location
 
         Args:
         frame: current frame av decode
-        file_ab_path: the template file path need to match
+        name: the template file name need to match, without .png
         """
         if(self.main_window.get_stop()):
             logger.info('stop match')
             return False,None
         # start_time = time()
         try:
-            target = cv2.imread(file_ab_path)
-            theight, twidth = target.shape[:2]
-            # frame = cv2.imread("D:\\Projects\\Python\\my-py-scrcpy-client\\scrcpy_ui\\simulator\\screenshot\\screenshot_3.png")     
-            result = cv2.matchTemplate(target, frame,cv2.TM_CCOEFF_NORMED)
-            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-            # logger.info('match %s result:%s',file_ab_path,max_val > self.threshold)
-            # stop_time = time()
-            # logger.info('time consume:%s',"{:.2}".format(stop_time-start_time))
-            return max_val > self.threshold, (max_loc[0]+twidth/2, max_loc[1]+theight/2)
+            found, location, score = self.matcher.match(frame, name, self.frame_id(frame))
+            # logger.info('match %s result:%s',name,found)
+            return found, location
             # return False, None
         except Exception as e:
             logger.error('出现异常,并继续%s',e)            
             return False, None
 
+    def match_all_latest_frame(self,frame,names):
+        """
+        match several template images with current frame at once, return the first matched one
+
+        Args:
+        frame: current frame av decode
+        names: the template file names, in priority order
+        returns: name and location of the first match, None if nothing matched
+        """
+        if(self.main_window.get_stop()):
+            logger.info('stop match')
+            return None
+        try:
+            matches = self.matcher.match_all(frame, names, self.frame_id(frame))
+            for name in names:
+                if(matches[name].found):
+                    return name, matches[name].location
+            return None
+        except Exception as e:
+            logger.error('出现异常,并继续%s',e)
+            return None
+
     def select_MOJIA_agency(self):
         """
         select the 墨家机关道 and solo ai
@@ -289,12 +313,12 @@ class AutoBattle():
 
         while True:
             if(self.in_battle == False and self.current_frame is not None):
-                for filename in screenshot_list:
-                    file_ab_path = ""+self.parent_path+filename+'.png'
-                    match, location = self.match_latest_frame(self.current_frame,file_ab_path)
-                    if(match):
-                        self.tap(location[0] , location[1])
-                        sleep(1)
+                # one scan of all buttons, the screen changes after a tap so only the first one is tapped
+                hit = self.match_all_latest_frame(self.current_frame,screenshot_list)
+                if(hit is not None):
+                    filename, location = hit
+                    self.tap(location[0] , location[1])
+                    sleep(1)
                 sleep(1)
                 logger.info("结束选择墨家机关道")
             sleep(1)
@@ -310,10 +334,8 @@ class AutoBattle():
 
         while True:
             if(self.current_frame is not None):
-                tp = ""+self.parent_path+'tp.png'
-                tp_dead = ""+self.parent_path+'tp-dead.png'            
-                is_tp, location = self.match_latest_frame(self.current_frame, tp)  
-                is_tp_dead, location = self.match_latest_frame(self.current_frame, tp_dead)                
+                is_tp, location = self.match_latest_frame(self.current_frame, 'tp')  
+                is_tp_dead, location = self.match_latest_frame(self.current_frame, 'tp-dead')                
                 self.in_battle = is_tp | is_tp_dead
 
                 if(not self.in_battle):
@@ -332,14 +354,12 @@ class AutoBattle():
             # sleep(5)
 
     def surrender(self):
-        setting = ""+self.parent_path+'setting.png'
-        surrender = ""+self.parent_path+'surrender.png'
-        match,location = self.match_latest_frame(self.current_frame, setting)
+        match,location = self.match_latest_frame(self.current_frame, 'setting')
         if(match):
             self.tap(location[0] , location[1])
             sleep(1)
             
-        match,location = self.match_latest_frame(self.current_frame, surrender)
+        match,location = self.match_latest_frame(self.current_frame, 'surrender')
         if(match):
             self.tap(location[0] , location[1])
         
@@ -357,21 +377,28 @@ class AutoBattle():
             else:
                 sleep(1)
 
-    def consume_queue(self):
+    def consume_frame(self):
+        """
+        keep current_frame as the latest frame, frames skipped in between are never converted
+        """
+        seq = 0
         while True:
-            self.current_frame=self.frame_queue.get()
-            # logger.info('queue size:%s',self.frame_queue.qsize())
+            try:
+                seq, frame = self.client.wait_frame(seq)
+                self.current = (seq, frame)
+                self.current_frame = frame
+            except ConnectionError:
+                # client stopped, wait for main loop to restart it
+                sleep(1)
 
     def detect_skill_upgrade(self):
         while True:
             if(self.in_battle):
-                upgrade_skill = ""+self.parent_path+'upgrade_skill.png'
-                match, location = self.match_latest_frame(self.current_frame,upgrade_skill)                
+                match, location = self.match_latest_frame(self.current_frame,'upgrade_skill')                
                 if(match):
                     self.tap(location[0] , location[1])
                 
-                upgrade_skill_2 = ""+self.parent_path+'upgrade_skill_2.png'
-                match, location = self.match_latest_frame(self.current_frame,upgrade_skill_2)
+                match, location = self.match_latest_frame(self.current_frame,'upgrade_skill_2')
                 if(match):
                     self.tap(location[0] , location[1])                                  
             sleep(2)
@@ -388,19 +415,19 @@ class AutoBattle():
         attack = [2200, 1400,40]
         while True:
             if(self.in_battle):            
-                enemy_healthbar = ""+self.parent_path+'enemy_healthbar.png'
-                match, location = self.match_latest_frame(self.current_frame,enemy_healthbar)
+                match, location = self.match_latest_frame(self.current_frame,'enemy_healthbar')
                 if(match):
                     logger.info('detect enemy!!! attack')
                     self.meet_enemy = True
                     try:
                         # self.tap(equip_1[0] , equip_1[1],equip_1[2])                        
 
-                        for i in range(5):
-                                self.tap(skill_1[0] , skill_1[1],skill_1[2])
-                                self.tap(skill_2[0] , skill_2[1],skill_2[2])
-                                self.tap(skill_3[0] , skill_3[1],skill_3[2])
-                                self.tap(attack[0] , attack[1],attack[2])                                
+                        # 5 rounds of the 4 buttons pressed together, one finger per button
+                        self.client.control.multi_touch([
+                            scrcpy.gesture.Track.tap(x, y, touch_id, hold=0.05, delay=i * 0.06)
+                            for i in range(5)
+                            for x, y, touch_id in [skill_1, skill_2, skill_3, attack]
+                        ])
                     except Exception as e:
                         logger.error(e)
                         continue
@@ -416,7 +443,7 @@ class AutoBattle():
         Thread(target=self.keep_move, args=()).start()
         Thread(target=self.detect_skill_upgrade, args=()).start()
         Thread(target=self.detect_enemy, args=()).start()
-        Thread(target=self.consume_queue, args=()).start()
+        Thread(target=self.consume_frame, args=()).start()
         
         return
 
@@ -439,7 +466,7 @@ def main():
     parser.add_argument("--encoder_name", type=str, help="Encoder name to use")
     args = parser.parse_args()
 
-    m = MainWindow(args.max_width, args.device, args.encoder_name,queue.LifoQueue())    
+    m = MainWindow(args.max_width, args.device, args.encoder_name)    
     m.show()
 
     battle = AutoBattle(        
@@ -0,0 +1,88 @@
+"""
+Compare h264 decode fps across decoder thread settings
+
+Usage: python scripts/benchmark_decode.py [--input raw.h264] [--width 1920 --height 1080 --frames 300]
+Without --input, a synthetic stream is encoded with libx264 first.
+"""
+
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from fractions import Fraction
+
+import av
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import scrcpy  # noqa: E402
+from scrcpy.decoder import auto_thread_count, create_codec  # noqa: E402
+
+
+def encode_synthetic(width: int, height: int, frames: int) -> bytes:
+    """
+    Encode moving noise, close to the worst case of a screen recording
+    """
+    encoder = av.CodecContext.create("libx264", "w")
+    encoder.width, encoder.height = width, height
+    encoder.pix_fmt = "yuv420p"
+    encoder.time_base = Fraction(1, 60)
+    encoder.bit_rate = 8000000
+    encoder.options = {"preset": "ultrafast", "tune": "zerolatency"}
+
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, (height, width, 3), np.uint8)
+    data = bytearray()
+    for i in range(frames):
+        image = np.roll(base, i * 8, axis=1)
+        frame = av.VideoFrame.from_ndarray(image, format="bgr24")
+        frame.pts = i
+        for packet in encoder.encode(frame):
+            data += bytes(packet)
+    for packet in encoder.encode(None):
+        data += bytes(packet)
+    return bytes(data)
+
+
+def benchmark(data: bytes, threads: int, thread_type: str, resolution) -> float:
+    """
+    Decode the whole stream, return frames per second
+    """
+    codec = create_codec(threads, thread_type, resolution)
+    count = 0
+    start = time.perf_counter()
+    for offset in range(0, len(data), 0x10000):
+        for packet in codec.parse(data[offset : offset + 0x10000]):
+            count += len(codec.decode(packet))
+    for packet in codec.parse(b""):
+        count += len(codec.decode(packet))
+    count += len(codec.decode(None))
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser(description="Decoder thread settings benchmark")
+    parser.add_argument("--input", type=str, help="Raw Annex B h264 file")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, "rb") as f:
+            data = f.read()
+    else:
+        data = encode_synthetic(args.width, args.height, args.frames)
+    resolution = (args.width, args.height)
+
+    print(f"cpu count: {os.cpu_count()}, auto threads: {auto_thread_count(resolution)}")
+    for thread_type in [scrcpy.DECODER_THREAD_SLICE, scrcpy.DECODER_THREAD_FRAME]:
+        for threads in [1, 2, 4, 8, 0]:
+            fps = benchmark(data, threads, thread_type, resolution)
+            name = "auto" if threads == 0 else threads
+            print(f"{thread_type:>5} threads={name:<4} {fps:8.1f} fps")
+
+
+if __name__ == "__main__":
+    main()
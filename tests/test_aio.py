@@ -0,0 +1,80 @@
+import asyncio
+import pathlib
+import pickle
+import socket
+from types import SimpleNamespace
+
+from scrcpy import AsyncClient
+from tests.utils import FakeStream
+
+
+class Sync:
+    @staticmethod
+    def push(a, b):
+        pass
+
+    @staticmethod
+    def stat(a):
+        return SimpleNamespace(size=0)
+
+
+class SocketADBDevice:
+
+    sync = Sync()
+
+    def __init__(self, connections):
+        self.connections = connections
+
+    @staticmethod
+    def shell(a, stream=True):
+        return FakeStream([b"\x00" * 128])
+
+    def create_connection(self, a, b):
+        return self.connections.pop(0)
+
+
+def test_async_client():
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    video, video_server = socket.socketpair()
+    control, control_server = socket.socketpair()
+    video_server.sendall(b"\x00" + b"test".ljust(64, b"\x00") + b"\x07\x80\x04\x38")
+
+    async def main():
+        client = AsyncClient(device=SocketADBDevice([video, control]), block_frame=True)
+        await client.start()
+        assert client.device_name == "test"
+
+        # Controls are written to the control socket
+        package = await client.control.touch(100, 200)
+        assert control_server.recv(1024) == package
+
+        # Clipboard reply is read from the control socket
+        clipboard = asyncio.ensure_future(client.control.get_clipboard())
+        await asyncio.sleep(0.1)
+        assert control_server.recv(1024) == b"\x08"
+        # Acks are skipped, a message may arrive in pieces
+        control_server.sendall(b"\x01" + b"\x00" * 7 + b"\x01" + b"\x00\x00\x00")
+        control_server.sendall(b"\x00\x05" + b"test0")
+        assert await asyncio.wait_for(clipboard, 5) == "test0"
+
+        for chunk in video_data:
+            video_server.sendall(chunk)
+        frames = []
+        async for frame in client.frames():
+            frames.append(frame)
+            if client.client.frame_slot.seq >= 3:
+                break
+        assert frames[-1].shape == (800, 368, 3)
+
+        # Closing the server ends the client
+        video_server.close()
+        await asyncio.sleep(0.1)
+        assert not client.alive
+        assert [frame async for frame in client.frames()] == []
+
+    asyncio.get_event_loop_policy().new_event_loop().run_until_complete(
+        asyncio.wait_for(main(), 10)
+    )
+    control_server.close()
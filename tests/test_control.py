@@ -1,7 +1,10 @@
 import threading
 
+import numpy as np
+import pytest
+
 import scrcpy
-from scrcpy.control import ControlSender
+from scrcpy.control import TOUCH_EVENT_DTYPE, ControlSender, ControlWriter, split_utf8
 from tests.utils import FakeStream
 
 
@@ -135,3 +138,175 @@ def test_swipe():
     control.swipe(2000, 2000, 100, 200)
     control.swipe(2000, 2000, -100, -200)
     control.swipe(100, 200, 2010, 2010, move_step_length=100)
+
+
+def test_control_writer():
+    class RecordingSocket:
+        def __init__(self):
+            self.writes = []
+
+        def sendall(self, data):
+            self.writes.append(data)
+
+    class WriterParent(MockParent):
+        def __init__(self):
+            super().__init__()
+            self.control_socket = RecordingSocket()
+            self.control_writer = ControlWriter(self, coalesce_moves=True)
+
+    parent = WriterParent()
+    sender = ControlSender(parent)
+
+    # Queued messages are sent in one write
+    down = sender.touch(100, 200, scrcpy.ACTION_DOWN)
+    moves = [sender.touch(100 + i, 200, scrcpy.ACTION_MOVE) for i in range(10)]
+    other = sender.touch(500, 500, scrcpy.ACTION_MOVE, touch_id=1)
+    last = sender.touch(120, 200, scrcpy.ACTION_MOVE)
+    up = sender.touch(120, 200, scrcpy.ACTION_UP)
+    parent.control_writer.flush()
+    assert parent.control_socket.writes == [down + moves[-1] + other + last + up]
+    assert parent.control_writer.coalesced == 9
+
+    # The writer thread flushes without being asked
+    parent.control_writer.start()
+    key = sender.keycode(scrcpy.KEYCODE_HOME)
+    for _ in range(100):
+        if len(parent.control_socket.writes) == 2:
+            break
+        threading.Event().wait(0.01)
+    parent.control_writer.stop()
+    assert parent.control_socket.writes[1] == key
+
+
+def test_control_writer_touch_many():
+    class RecordingSocket:
+        def __init__(self):
+            self.writes = []
+
+        def sendall(self, data):
+            self.writes.append(data)
+
+    class WriterParent(MockParent):
+        def __init__(self):
+            super().__init__()
+            self.control_socket = RecordingSocket()
+            self.control_writer = ControlWriter(self, coalesce_moves=True)
+
+    parent = WriterParent()
+    sender = ControlSender(parent)
+
+    # A batch is never merged with single moves, its UP would be lost
+    events = np.zeros(2, TOUCH_EVENT_DTYPE)
+    events["x"] = [100, 300]
+    events["action"] = [scrcpy.ACTION_MOVE, scrcpy.ACTION_UP]
+    events["touch_id"] = [0, 1]
+    move = sender.touch(50, 50, scrcpy.ACTION_MOVE, touch_id=0)
+    batch = sender.touch_many(events)
+    last = sender.touch(120, 200, scrcpy.ACTION_MOVE, touch_id=0)
+    parent.control_writer.flush()
+    assert parent.control_socket.writes == [move + batch + last]
+    assert parent.control_writer.coalesced == 0
+
+    # A batch of one event is a single move
+    sender.touch_many(events[:1])
+    last = sender.touch(130, 200, scrcpy.ACTION_MOVE, touch_id=0)
+    parent.control_writer.flush()
+    assert parent.control_socket.writes[1] == last
+    assert parent.control_writer.coalesced == 1
+
+
+def test_control_touch_many():
+    events = np.zeros(3, TOUCH_EVENT_DTYPE)
+    events["x"] = [100, -5, 300]
+    events["y"] = [200, 250, 300]
+    events["action"] = [scrcpy.ACTION_DOWN, scrcpy.ACTION_MOVE, scrcpy.ACTION_UP]
+    events["touch_id"] = [-1, -1, 2]
+    assert control.touch_many(events) == (
+        control.touch(100, 200, scrcpy.ACTION_DOWN)
+        + control.touch(0, 250, scrcpy.ACTION_MOVE)
+        + control.touch(300, 300, scrcpy.ACTION_UP, touch_id=2)
+    )
+    # The buffer is reused for smaller batches
+    assert control.touch_many(events[:1]) == control.touch(100, 200)
+
+
+def test_control_tap():
+    class RecordingParent(MockParent):
+        def __init__(self):
+            super().__init__()
+            self.control_socket = self
+            self.sent = []
+
+        def send(self, data):
+            self.sent.append(data)
+
+    parent = RecordingParent()
+    sender = ControlSender(parent)
+    future = sender.tap(100, 200, hold=0.05)
+    # Press is sent at once, release later
+    assert parent.sent == [control.touch(100, 200, scrcpy.ACTION_DOWN)]
+    release = future.result(1)
+    assert release == control.touch(100, 200, scrcpy.ACTION_UP)
+    assert parent.sent == [control.touch(100, 200, scrcpy.ACTION_DOWN), release]
+
+
+def test_type_text():
+    class RecordingParent(MockParent):
+        def __init__(self):
+            super().__init__()
+            self.control_socket = self
+            self.sent = []
+
+        def send(self, data):
+            self.sent.append(data)
+
+    parent = RecordingParent()
+    sender = ControlSender(parent)
+    text = "héllo wörld, 你好世界 🎉" * 40
+    # Pieces of 7 characters, chunks of 10 bytes
+    pieces = [text[i : i + 7] for i in range(0, len(text), 7)]
+    stats = sender.type_text(pieces, chunk_size=10)
+
+    payloads = []
+    for message in parent.sent:
+        assert message[0] == scrcpy.TYPE_INJECT_TEXT
+        length = int.from_bytes(message[1:5], "big")
+        assert length == len(message) - 5 <= 10
+        # Every chunk decodes alone, no character is cut
+        payloads.append(message[5:].decode("utf-8"))
+    assert "".join(payloads) == text
+    assert stats.chunks == len(parent.sent)
+    assert stats.bytes == len(text.encode("utf-8"))
+
+    # Paced sending
+    parent.sent.clear()
+    stats = sender.type_text("a" * 100, chunk_size=10, max_bytes_per_second=1000)
+    assert stats.chunks == 10
+    assert stats.seconds >= 0.09
+
+
+def test_control_type_text_small_chunks():
+    class RecordingParent(MockParent):
+        def __init__(self):
+            super().__init__()
+            self.control_socket = self
+            self.sent = []
+
+        def send(self, data):
+            self.sent.append(data)
+
+    parent = RecordingParent()
+    sender = ControlSender(parent)
+    text = "中🎉é中a🎉"
+    for chunk_size in [4, 5, 6]:
+        parent.sent.clear()
+        sender.type_text(text, chunk_size=chunk_size)
+        payloads = [message[5:] for message in parent.sent]
+        assert all(0 < len(payload) <= chunk_size for payload in payloads)
+        assert b"".join(payloads).decode("utf-8") == text
+
+    # Too small for a 4 bytes character
+    with pytest.raises(AssertionError):
+        sender.type_text("中", chunk_size=2)
+    with pytest.raises(ValueError):
+        split_utf8("🎉".encode("utf-8"), 3)
@@ -1,9 +1,16 @@
+import os
 import pathlib
 import pickle
+import socket
+import threading
+import time
+from types import SimpleNamespace
 
 import pytest
 from adbutils import AdbError
+from av.codec import CodecContext
 
+import scrcpy
 from scrcpy import Client
 from tests.utils import FakeStream
 
@@ -13,6 +20,10 @@ class Sync:
     def push(a, b):
         pass
 
+    @staticmethod
+    def stat(a):
+        return SimpleNamespace(size=0)
+
 
 class FakeADBDevice:
 
@@ -110,3 +121,433 @@ def test_parse_video():
     assert frames[0] is None
     assert frames[1].shape == (800, 368, 3)
     assert frames[2].shape == (800, 368, 3)
+
+
+def test_parse_video_pipelined():
+    def on_frame(frame):
+        frames.append(frame)
+        if len(frames) == 3:
+            done.set()
+
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    data = [[b"\x00", b"test", b"\x07\x80\x04\x38", None] + video_data, []]
+    frames = []
+    done = threading.Event()
+
+    client = Client(
+        device=FakeADBDevice(data),
+        flip=True,
+        pipelined=True,
+        frame_drop_policy=scrcpy.DROP_POLICY_BLOCK,
+    )
+    client.add_listener("frame", on_frame)
+    client.start(threaded=True)
+    try:
+        assert done.wait(5)
+    finally:
+        client.stop()
+
+    assert client.packet_queue.dropped == 0
+    assert client.frame_queue.dropped == 0
+    # No None frames in pipelined mode
+    assert [frame.shape for frame in frames] == [(800, 368, 3)] * 3
+
+
+def test_parse_video_latest():
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    data = [[b"\x00", b"test", b"\x07\x80\x04\x38", None] + video_data, []]
+
+    client = Client(device=FakeADBDevice(data), delivery=scrcpy.DELIVERY_LATEST)
+    client.start(threaded=True)
+    seq, frame = 0, None
+    while seq < 3:
+        new_seq, frame = client.wait_frame(seq, timeout=5)
+        assert new_seq > seq
+        seq = new_seq
+    client.stop()
+
+    assert client.resolution == (368, 800)
+    assert frame.shape == (800, 368, 3)
+    assert client.last_frame is frame
+
+    # Stopped client wakes up waiting consumers
+    with pytest.raises(ConnectionError):
+        client.wait_frame(seq, timeout=5)
+
+    client.last_frame = frame[:10]
+    assert client.wait_frame(seq, timeout=0)[1].shape == (10, 368, 3)
+
+
+def test_frame():
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    codec = CodecContext.create("h264", "r")
+    video_frame = [
+        frame
+        for raw in video_data
+        for packet in codec.parse(raw)
+        for frame in codec.decode(packet)
+    ][0]
+
+    frame = scrcpy.Frame(video_frame)
+    assert (frame.width, frame.height) == (368, 800)
+    assert frame.bgr.shape == (800, 368, 3)
+    assert frame.rgb.shape == (800, 368, 3)
+    assert frame.gray.shape == (800, 368)
+    assert [plane.shape for plane in frame.yuv_planes] == [
+        (800, 368),
+        (400, 184),
+        (400, 184),
+    ]
+    assert (frame.rgb[..., ::-1] == frame.bgr).all()
+
+    # Each conversion runs once
+    assert frame.bgr is frame.bgr
+    assert frame.gray is frame.gray
+    assert frame.yuv_planes is frame.yuv_planes
+
+    flipped = scrcpy.Frame(video_frame, flip=True)
+    assert (flipped.bgr == frame.bgr[:, ::-1]).all()
+    assert (flipped.gray == frame.gray[:, ::-1]).all()
+
+    # gray packs the Y plane without splitting the chroma planes
+    gray_frame = scrcpy.Frame(video_frame)
+    gray = gray_frame.gray
+    assert gray.flags.c_contiguous and gray.flags.owndata and gray.flags.writeable
+    assert (gray == frame.yuv_planes[0]).all()
+    assert "yuv_planes" not in gray_frame._Frame__cache
+
+
+def test_parse_video_lazy_frame():
+    def on_frame(frame):
+        if frame is not None:
+            frames.append(frame)
+        if len(frames) == 3:
+            client.stop()
+
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    data = [[b"\x00", b"test", b"\x07\x80\x04\x38", None] + video_data, []]
+    frames = []
+
+    client = Client(device=FakeADBDevice(data), lazy_frame=True)
+    client.add_listener("frame", on_frame)
+    client.start()
+
+    assert all(isinstance(frame, scrcpy.Frame) for frame in frames)
+    assert frames[-1].gray.shape == (800, 368)
+    assert client.last_frame is frames[-1].bgr
+
+
+def test_frame_y_plane():
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    codec = CodecContext.create("h264", "r")
+    packets = [packet for raw in video_data for packet in codec.parse(raw)]
+    frame = scrcpy.Frame(codec.decode(packets[0])[0])
+
+    y_plane = frame.y_plane
+    assert y_plane.shape == (800, 368)
+    assert not y_plane.flags.owndata and not y_plane.flags.writeable
+    # Rows keep the decoder's line size
+    assert y_plane.strides[0] == frame.video_frame.planes[0].line_size
+    assert (y_plane == frame.gray).all()
+    assert y_plane is frame.y_plane
+
+    flipped = scrcpy.Frame(frame.video_frame, flip=True).y_plane
+    assert (flipped == y_plane[:, ::-1]).all()
+
+    # The view keeps the buffer alive after the frame is gone and decoding goes on
+    expected = y_plane.copy()
+    del frame, flipped
+    for packet in packets[1:]:
+        codec.decode(packet)
+    assert (y_plane == expected).all()
+
+
+def test_frame_pool():
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    codec = CodecContext.create("h264", "r")
+    video_frames = [
+        frame
+        for raw in video_data
+        for packet in codec.parse(raw)
+        for frame in codec.decode(packet)
+    ]
+
+    pool = scrcpy.FramePool(2, (368, 800))
+    images = [scrcpy.Frame(frame, True, pool).bgr for frame in video_frames]
+    expected = scrcpy.Frame(video_frames[2], True).bgr
+    assert images[2].shape == (800, 368, 3)
+    assert abs(images[2].astype(int) - expected).max() <= 3
+
+    # Ring of 2 buffers: the third frame reuses the first buffer
+    assert images[2] is images[0]
+    assert images[1] is not images[0]
+
+    # Rotated device
+    i420, bgr = pool.acquire(800, 368)
+    assert pool.resolution == (800, 368)
+    assert bgr.shape == (368, 800, 3) and i420.shape == (552, 800)
+
+
+def test_parse_video_frame_pool():
+    def on_frame(frame):
+        if frame is not None:
+            frames.append(frame.copy())
+        if len(frames) == 3:
+            client.stop()
+
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    data = [[b"\x00", b"test", b"\x07\x80\x04\x38", None] + video_data, []]
+    frames = []
+
+    client = Client(device=FakeADBDevice(data), frame_pool_size=2)
+    client.add_listener("frame", on_frame)
+    client.start()
+
+    assert [frame.shape for frame in frames] == [(800, 368, 3)] * 3
+    assert client.frame_pool.resolution == (368, 800)
+
+
+def test_keyframes_only():
+    class RecordingADBDevice(FakeADBDevice):
+        def shell(self, cmd, stream=True):
+            commands.append(cmd)
+            return FakeStream([b"\x00" * 128])
+
+    def on_frame(frame):
+        if frame is not None:
+            frames.append(frame)
+
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    data = [[b"\x00", b"test", b"\x07\x80\x04\x38"] + video_data + [b"OSError"], []]
+    frames = []
+    commands = []
+
+    client = Client(
+        device=RecordingADBDevice(data), keyframes_only=True, keyframe_interval=0.5
+    )
+    client.add_listener("frame", on_frame)
+    with pytest.raises(OSError):
+        client.start()
+
+    # Only the IDR frame is decoded, P frames are dropped before decoding
+    assert len(frames) == 1
+    assert "codec_options=i-frame-interval:float=0.5" in commands[0]
+
+
+def test_selector_idle():
+    class SocketADBDevice(FakeADBDevice):
+        def create_connection(self, a, b):
+            return self.data.pop(0)
+
+    def on_frame(frame):
+        frames.append(frame)
+        if len(frames) == 3:
+            done.set()
+
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    video, server = socket.socketpair()
+    server.sendall(b"\x00" + b"test".ljust(64, b"\x00") + b"\x07\x80\x04\x38")
+    frames = []
+    idles = []
+    done = threading.Event()
+
+    client = Client(
+        device=SocketADBDevice([video, FakeStream()]),
+        block_frame=True,
+        idle_timeout=0.05,
+    )
+    client.add_listener("frame", on_frame)
+    client.add_listener("idle", lambda: idles.append(True))
+    client.start(threaded=True)
+    try:
+        # Idle events instead of None frames while the socket is silent
+        threading.Event().wait(0.3)
+        assert len(idles) > 0
+        assert frames == []
+
+        for chunk in video_data:
+            server.sendall(chunk)
+        assert done.wait(5)
+        assert [frame.shape for frame in frames] == [(800, 368, 3)] * 3
+
+        # Without idle listeners, the loop sleeps until stop wakes it up
+        client.listeners["idle"].clear()
+        threading.Event().wait(0.1)
+    finally:
+        client.stop()
+        server.close()
+    client.stream_loop_thread.join(1)
+    assert not client.stream_loop_thread.is_alive()
+
+
+def test_parse_video_decode_process():
+    def on_frame(frame):
+        frames.append(frame.copy())
+        if len(frames) == 3:
+            done.set()
+
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    data = [[b"\x00", b"test", b"\x07\x80\x04\x38"] + video_data, []]
+    frames = []
+    done = threading.Event()
+
+    client = Client(
+        device=FakeADBDevice(data),
+        flip=True,
+        block_frame=True,
+        decode_process=True,
+    )
+    client.add_listener("frame", on_frame)
+    client.start(threaded=True)
+    try:
+        assert done.wait(30)
+        assert client.last_frame.shape == (800, 368, 3)
+    finally:
+        client.stop()
+
+    assert [frame.shape for frame in frames[:3]] == [(800, 368, 3)] * 3
+    assert client.resolution == (368, 800)
+
+    # Same pixels as decoding in this process
+    codec = CodecContext.create("h264", "r")
+    expected = []
+    for chunk in video_data:
+        for packet in codec.parse(chunk):
+            expected += [scrcpy.Frame(f, flip=True).bgr for f in codec.decode(packet)]
+    assert (frames[0] == expected[0]).all()
+
+
+def test_deploy_cache():
+    class RemoteSync:
+        def __init__(self):
+            self.files = {}
+
+        def push(self, a, b):
+            self.files[b] = os.path.getsize(a)
+
+        def stat(self, a):
+            return SimpleNamespace(size=self.files.get(a, 0))
+
+    class CachingADBDevice(FakeADBDevice):
+        sync = RemoteSync()
+
+    def create_client():
+        return Client(
+            device=CachingADBDevice(
+                [[b"\x00", b"test", b"\x07\x80\x04\x38", b"OSError"], []]
+            )
+        )
+
+    client = create_client()
+    with pytest.raises(OSError):
+        client.start()
+    assert client.server_pushed
+    assert client.startup_time is not None
+    (remote_path,) = CachingADBDevice.sync.files
+
+    # Same jar is already on the device
+    client = create_client()
+    with pytest.raises(OSError):
+        client.start()
+    assert not client.server_pushed
+
+    # Partial push
+    CachingADBDevice.sync.files[remote_path] -= 1
+    client = create_client()
+    with pytest.raises(OSError):
+        client.start()
+    assert client.server_pushed
+
+
+def test_reconnect():
+    inits = []
+    handshake = [b"\x00", b"test", b"\x07\x80\x04\x38"]
+    client = Client(device=FakeADBDevice([handshake[:], [], handshake[:], []]))
+    client.add_listener("init", lambda: inits.append(client.device_name))
+    client.start(threaded=True)
+    first = client.stream_loop_thread
+    client.reconnect()
+    try:
+        assert not first.is_alive()
+        assert client.stream_loop_thread is not first
+        assert client.alive
+        assert inits == ["test", "test"]
+    finally:
+        client.stop()
+
+
+def test_reconnect_from_listener():
+    handshake = [b"\x00", b"test", b"\x07\x80\x04\x38"]
+    client = Client(device=FakeADBDevice([handshake[:], [], handshake[:], []]))
+    threads = []
+
+    def on_idle():
+        threads.append(client.stream_loop_thread)
+        if len(threads) == 1:
+            client.reconnect()
+
+    client.add_listener(scrcpy.EVENT_IDLE, on_idle)
+    client.start(threaded=True)
+    try:
+        while len(threads) < 2:
+            time.sleep(0.01)
+        first = threads[0]
+        # The loop of the first run quits although the client is alive again
+        first.join(1)
+        assert not first.is_alive()
+        assert client.stream_loop_thread is not first
+        assert client.stream_loop_thread.is_alive()
+    finally:
+        client.stop()
+
+
+def test_server_ready():
+    class LoggingADBDevice(FakeADBDevice):
+        @staticmethod
+        def shell(a, stream=True):
+            # Output arrives in pieces, the marker is split between two reads
+            return FakeStream(
+                [b"[server] DEBUG: start\n[server] INFO: Dev", b"ice: test\n", None]
+            )
+
+    handshake = [b"\x00", b"test", b"\x07\x80\x04\x38"]
+    client = Client(device=LoggingADBDevice([handshake[:], []], wait=2))
+    client.start(threaded=True)
+    client.stop()
+    assert client.server_ready
+    assert set(client.startup_phases) == {"push", "spawn", "socket", "handshake"}
+    assert sum(client.startup_phases.values()) <= client.startup_time
+
+    # No readiness line, the socket is polled
+    client = Client(device=FakeADBDevice([handshake[:], []], wait=2))
+    client.start(threaded=True)
+    client.stop()
+    assert not client.server_ready
+
+    # Real timeout in the message
+    client = Client(
+        device=FakeADBDevice([handshake[:], []], wait=1000), connection_timeout=50
+    )
+    with pytest.raises(ConnectionError) as e:
+        client.start()
+    assert "50 ms" in str(e.value)
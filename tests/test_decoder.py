@@ -0,0 +1,35 @@
+import os
+import pathlib
+import pickle
+
+import scrcpy
+from scrcpy.decoder import auto_thread_count, create_codec
+
+
+def test_auto_thread_count():
+    cpu_count = os.cpu_count() or 1
+    assert auto_thread_count((368, 800)) == 1
+    assert auto_thread_count((1920, 1080)) == min(3, cpu_count)
+    assert 1 <= auto_thread_count(None) <= 2
+
+
+def test_create_codec():
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    codec = create_codec(4, scrcpy.DECODER_THREAD_FRAME)
+    assert codec.thread_count == 4
+
+    frames = [
+        frame
+        for raw in video_data
+        for packet in codec.parse(raw)
+        for frame in codec.decode(packet)
+    ]
+    # Frame threads hold frames back until flushed
+    frames += codec.decode(None)
+    assert [(frame.width, frame.height) for frame in frames] == [(368, 800)] * 3
+
+    assert create_codec(0, resolution=(1920, 1080)).thread_count == min(
+        3, os.cpu_count() or 1
+    )
@@ -0,0 +1,66 @@
+import socket
+import threading
+
+import pytest
+
+import scrcpy
+from scrcpy.control import ControlSender
+from scrcpy.device_message import DeviceMessageParser, DeviceMessageReader
+
+
+def clipboard_message(text):
+    data = text.encode("utf-8")
+    return b"\x00" + len(data).to_bytes(4, "big") + data
+
+
+def test_parser():
+    parser = DeviceMessageParser()
+    data = clipboard_message("hello") + b"\x01" + (7).to_bytes(8, "big")
+    data += clipboard_message("x" * 100000)
+
+    # Messages split at any point are reassembled
+    messages = []
+    for i in range(0, len(data), 3):
+        messages += parser.feed(data[i : i + 3])
+    assert messages == [
+        (scrcpy.DEVICE_MSG_TYPE_CLIPBOARD, "hello"),
+        (scrcpy.DEVICE_MSG_TYPE_ACK_CLIPBOARD, 7),
+        (scrcpy.DEVICE_MSG_TYPE_CLIPBOARD, "x" * 100000),
+    ]
+
+    with pytest.raises(ConnectionError):
+        parser.feed(b"\x42")
+
+
+def test_reader():
+    class ReaderParent:
+        resolution = (1920, 1080)
+
+        def __init__(self, control_socket):
+            self.control_socket = control_socket
+            self.control_socket_lock = threading.Lock()
+            self.device_message_reader = DeviceMessageReader(
+                control_socket, changes.append
+            )
+
+    changes = []
+    control, server = socket.socketpair()
+    parent = ReaderParent(control)
+    parent.device_message_reader.start()
+    sender = ControlSender(parent)
+
+    future = sender.request_clipboard()
+    assert server.recv(1) == b"\x08"  # TYPE_GET_CLIPBOARD
+    text = "剪贴板" * 50000
+    server.sendall(clipboard_message(text))
+    assert future.result(5) == text
+    assert changes == [text]
+
+    # Pending requests fail once the socket closes
+    future = sender.request_clipboard()
+    server.close()
+    with pytest.raises(ConnectionError):
+        future.result(5)
+    parent.device_message_reader.reader_thread.join(5)
+    assert not parent.device_message_reader.alive
+    control.close()
@@ -0,0 +1,82 @@
+import time
+
+import numpy as np
+import pytest
+
+import scrcpy
+from scrcpy import gesture
+
+
+class RecordingControl:
+    def __init__(self):
+        self.events = []
+        self.writes = 0
+
+    def touch_many(self, events):
+        self.writes += 1
+        for event in events:
+            self.events.append(
+                (
+                    time.monotonic(),
+                    int(event["x"]),
+                    int(event["y"]),
+                    int(event["action"]),
+                    int(event["touch_id"]),
+                )
+            )
+
+
+def test_trajectory():
+    times, points = gesture.trajectory((0, 0), (100, 300), 0.1, 0.01)
+    assert len(times) == len(points) == 11
+    assert times[0] == 0 and times[-1] == pytest.approx(0.1)
+    assert points[0].tolist() == [0, 0]
+    assert points[-1].tolist() == [100, 300]
+    # Straight line, both axes arrive together
+    assert (points[:, 1] == points[:, 0] * 3).all()
+
+    # Eased moves start slow
+    _, eased = gesture.trajectory((0, 0), (100, 0), 0.1, 0.01, scrcpy.EASING_IN)
+    assert eased[1][0] < points[1][0]
+    assert eased[-1].tolist() == [100, 0]
+    with pytest.raises(ValueError):
+        gesture.ease(np.zeros(1), "bounce")
+
+
+def test_play():
+    control = RecordingControl()
+    times, points = gesture.trajectory((0, 0), (200, 0), 0.1, 0.01)
+    gesture.play(control, times, points)
+
+    actions = [event[3] for event in control.events]
+    assert actions[0] == scrcpy.ACTION_DOWN
+    assert actions[1:-1] == [scrcpy.ACTION_MOVE] * 9
+    assert actions[-1] == scrcpy.ACTION_UP
+    assert control.events[-1][1] == 200
+    # Duration follows the schedule, not the number of moves
+    elapsed = control.events[-1][0] - control.events[0][0]
+    assert 0.1 <= elapsed < 0.2
+
+
+def test_play_tracks():
+    control = RecordingControl()
+    taps = [gesture.Track.tap(100 * i, 100, touch_id=i, hold=0.02) for i in range(4)]
+    pinch = [
+        gesture.Track.swipe((500, 500), (300, 300), 0.05, 0.01, touch_id=4),
+        gesture.Track.swipe((600, 600), (800, 800), 0.05, 0.01, touch_id=5),
+    ]
+    gesture.play_tracks(control, taps + pinch)
+
+    # Per pointer order is kept
+    for touch_id in range(6):
+        actions = [e[3] for e in control.events if e[4] == touch_id]
+        assert actions[0] == scrcpy.ACTION_DOWN
+        assert actions[-1] == scrcpy.ACTION_UP
+    # Events due together share one write, ticks at 0, 10, 20, 30, 40 and 50 ms
+    assert len(control.events) == 4 * 2 + 2 * 6
+    assert control.writes <= 7
+    assert control.events[-1][0] - control.events[0][0] < 0.1
+
+    # A single point track presses and releases at once
+    times, events = gesture.Track([0], [(1, 2)]).events()
+    assert events["action"].tolist() == [scrcpy.ACTION_DOWN, scrcpy.ACTION_UP]
@@ -0,0 +1,30 @@
+import pathlib
+import pickle
+
+from av.codec import CodecContext
+
+from scrcpy import h264
+
+
+def test_keyframe():
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    codec = CodecContext.create("h264", "r")
+    packets = [packet for raw in video_data for packet in codec.parse(raw)]
+
+    assert list(h264.iter_nal_types(packets[0]))[:2] == [7, 8]  # SPS, PPS
+    assert [h264.is_keyframe(packet) for packet in packets] == [True, False, False]
+    assert h264.is_resync_point(bytes(packets[0])[:5])  # SPS only
+    assert not h264.is_resync_point(packets[1])
+
+
+def test_disposable():
+    non_reference = b"\x00\x00\x00\x01\x01\x9a\x00"  # nal_ref_idc 0, non-IDR slice
+    reference = b"\x00\x00\x00\x01\x41\x9a\x00"  # nal_ref_idc 2, non-IDR slice
+    sei = b"\x00\x00\x01\x06\x05\x00"
+
+    assert h264.is_disposable(non_reference)
+    assert h264.is_disposable(sei + non_reference)
+    assert not h264.is_disposable(reference)
+    assert not h264.is_disposable(sei)
@@ -0,0 +1,102 @@
+import pathlib
+import pickle
+import socket
+import threading
+from types import SimpleNamespace
+
+from scrcpy import Client, DeviceHub
+from tests.utils import FakeStream
+
+
+class Sync:
+    @staticmethod
+    def push(a, b):
+        pass
+
+    @staticmethod
+    def stat(a):
+        return SimpleNamespace(size=0)
+
+
+class SocketADBDevice:
+
+    sync = Sync()
+
+    def __init__(self, video, control):
+        self.connections = [video, control]
+
+    @staticmethod
+    def shell(a, stream=True):
+        return FakeStream([b"\x00" * 128])
+
+    def create_connection(self, a, b):
+        return self.connections.pop(0)
+
+
+def create_device():
+    video, server = socket.socketpair()
+    control, control_server = socket.socketpair()
+    server.sendall(b"\x00" + b"test".ljust(64, b"\x00") + b"\x07\x80\x04\x38")
+    return SocketADBDevice(video, control), server, control_server
+
+
+def test_hub():
+    video_data = pickle.load(
+        (pathlib.Path(__file__).parent / "test_video_data.pkl").resolve().open("rb")
+    )
+    hub = DeviceHub(workers=2)
+    frames = {}
+    servers = []
+    controls = []
+    clipboards = []
+    done = threading.Semaphore(0)
+
+    def on_frame(name, frame):
+        frames[name].append(frame)
+        if len(frames[name]) == 3:
+            done.release()
+
+    hub.start(threaded=True)
+    try:
+        for name in ["a", "b", "c"]:
+            device, server, control = create_device()
+            servers.append(server)
+            controls.append(control)
+            frames[name] = []
+            client = Client(device=device, block_frame=True)
+            client.add_listener("frame", lambda frame, name=name: on_frame(name, frame))
+            client.add_listener(
+                "clipboard", lambda text, name=name: clipboards.append((name, text))
+            )
+            hub.add(client)
+            assert client.stream_loop_thread is None
+            # Device messages are read by the hub loop, not by a thread per client
+            assert client.device_message_reader.reader_thread is None
+
+        for chunk in video_data:
+            for server in servers:
+                server.sendall(chunk)
+        for _ in servers:
+            assert done.acquire(timeout=5)
+        for name in frames:
+            assert [frame.shape for frame in frames[name][:3]] == [(800, 368, 3)] * 3
+
+        future = hub.clients[1].device_message_reader.expect_clipboard()
+        controls[1].sendall(b"\x00\x00\x00\x00\x05hello")
+        assert future.result(timeout=5) == "hello"
+        assert clipboards == [("b", "hello")]
+
+        # Clients closed by the server are detached
+        servers.pop().close()
+        hub.remove(hub.clients[0])
+        for _ in range(50):
+            if len(hub.clients) == 1:
+                break
+            threading.Event().wait(0.1)
+        assert len(hub.clients) == 1
+    finally:
+        hub.stop()
+        for server in servers + controls:
+            server.close()
+    assert not hub.loop_thread.is_alive()
+    assert hub.errors == []
@@ -0,0 +1,75 @@
+import threading
+from queue import Empty, Full
+
+import pytest
+
+import scrcpy
+from scrcpy.pipeline import BoundedQueue, LatestFrame
+
+
+def test_drop_policy_block():
+    queue = BoundedQueue(2, scrcpy.DROP_POLICY_BLOCK)
+    queue.put(1)
+    queue.put(2)
+    with pytest.raises(Full):
+        queue.put(3, timeout=0.01)
+    assert queue.get() == 1
+    queue.put(3)
+    assert [queue.get(), queue.get()] == [2, 3]
+    assert queue.dropped == 0
+    with pytest.raises(Empty):
+        queue.get(timeout=0.01)
+
+
+def test_drop_policy_oldest():
+    queue = BoundedQueue(2, scrcpy.DROP_POLICY_OLDEST)
+    for i in range(5):
+        queue.put(i)
+    assert len(queue) == 2
+    assert queue.dropped == 3
+    assert [queue.get(), queue.get()] == [3, 4]
+
+
+def test_drop_policy_newest():
+    queue = BoundedQueue(2, scrcpy.DROP_POLICY_NEWEST)
+    for i in range(5):
+        queue.put(i)
+    assert queue.dropped == 3
+    assert [queue.get(), queue.get()] == [0, 1]
+
+
+def test_latest_frame():
+    converted = []
+
+    def convert(frame):
+        converted.append(frame)
+        return frame * 10
+
+    slot = LatestFrame(convert)
+    assert slot.get() == (0, None)
+    assert slot.wait(0, timeout=0.01) == (0, None)
+
+    for i in range(1, 4):
+        slot.publish(i)
+    assert slot.get() == (3, 30)
+    assert slot.wait(0) == (3, 30)
+    assert slot.wait(3, timeout=0.01) == (3, 30)
+
+    # Overwritten frames are never converted, each frame is converted once
+    assert converted == [3]
+
+    threading.Timer(0.05, slot.publish, args=(4,)).start()
+    assert slot.wait(3, timeout=5) == (4, 40)
+
+
+def test_latest_frame_close():
+    slot = LatestFrame(lambda frame: frame)
+    threading.Timer(0.05, slot.close).start()
+    with pytest.raises(ConnectionError):
+        slot.wait(0, timeout=5)
+
+    # Newer frames are still returned after close, reopening accepts waits again
+    slot.publish(1)
+    assert slot.wait(0) == (1, 1)
+    slot.open()
+    assert slot.wait(1, timeout=0.01) == (1, 1)
@@ -0,0 +1,28 @@
+import threading
+import time
+
+import pytest
+
+from scrcpy.scheduler import Scheduler
+
+
+def test_scheduler():
+    scheduler = Scheduler()
+    calls = []
+    start = time.monotonic()
+
+    # Run by deadline, not by submission order
+    late = scheduler.call_later(0.1, lambda: calls.append("late") or "late")
+    early = scheduler.call_later(0.05, lambda: calls.append("early"))
+    skipped = scheduler.call_later(0.05, lambda: calls.append("skipped"))
+    assert skipped.cancel()
+
+    assert late.result(1) == "late"
+    assert early.done()
+    assert calls == ["early", "late"]
+    assert time.monotonic() - start >= 0.1
+
+    failed = scheduler.call_later(0, lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        failed.result(1)
+    assert len(scheduler) == 0
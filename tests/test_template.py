@@ -0,0 +1,228 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from scrcpy import TemplateMatcher, TemplateRegistry
+
+
+def create_scene(tmp_path, names=("button",)):
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (240, 320, 3), np.uint8)
+    for i, name in enumerate(names):
+        cv2.imwrite(
+            str(tmp_path / f"{name}.png"), frame[40:80, 60 + 80 * i : 120 + 80 * i]
+        )
+    return frame
+
+
+def test_template_registry(tmp_path):
+    create_scene(tmp_path, ["a", "b", "c"])
+    registry = TemplateRegistry(str(tmp_path), capacity=2, check_interval=0)
+    assert registry.names() == ["a", "b", "c"]
+
+    a = registry.get("a")
+    assert registry.get("a") is a
+    assert a.image.shape == (40, 60, 3)
+
+    # Least recently used is evicted
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+    assert len(registry) == 2
+    assert registry.get("a") is a
+    assert registry.stats()["b"].loads == 1
+    registry.get("b")
+    assert registry.stats()["b"].loads == 2
+
+    # Changed file is loaded again
+    os.utime(a.path, (a.mtime + 10, a.mtime + 10))
+    assert registry.get("a") is not a
+
+    with pytest.raises(FileNotFoundError):
+        registry.get("missing")
+
+
+def test_template_registry_check_interval(tmp_path):
+    create_scene(tmp_path)
+    registry = TemplateRegistry(str(tmp_path), check_interval=60)
+    template = registry.get("button")
+    os.utime(template.path, (template.mtime + 10, template.mtime + 10))
+    assert registry.get("button") is template
+
+
+def test_template_registry_prepare(tmp_path):
+    create_scene(tmp_path)
+    registry = TemplateRegistry(str(tmp_path), grayscale=True, scale=0.5)
+    registry.preload()
+    assert len(registry) == 1
+    assert registry.get("button").image.shape == (20, 30)
+    assert registry.prepare(np.zeros((240, 320, 3), np.uint8)).shape == (120, 160)
+
+
+@pytest.mark.parametrize("grayscale,scale", [(False, 1), (True, 1), (True, 0.5)])
+def test_template_matcher(tmp_path, grayscale, scale):
+    frame = create_scene(tmp_path)
+    matcher = TemplateMatcher(TemplateRegistry(str(tmp_path), grayscale, scale))
+
+    found, (x, y), score = matcher.match(frame, "button")
+    assert found
+    assert abs(x - 90) <= 2 and abs(y - 60) <= 2
+
+    found, _, _ = matcher.match(np.zeros_like(frame), "button")
+    assert not found
+
+    found, location, _ = matcher.match(frame[:10, :10], "button")
+    assert not found and location is None
+
+    stats = matcher.registry.stats()["button"]
+    assert (stats.loads, stats.matches, stats.hits) == (1, 2, 1)
+
+
+def test_template_matcher_roi(tmp_path):
+    frame = create_scene(tmp_path)
+    registry = TemplateRegistry(str(tmp_path))
+    matcher = TemplateMatcher(registry, roi_margin=0.1)
+
+    assert matcher.match(frame, "button").found
+    assert registry.roi("button") == (60 / 320, 40 / 240, 120 / 320, 80 / 240)
+    found, (x, y), _ = matcher.match(frame, "button")
+    assert found and (x, y) == (90, 60)
+    assert registry.stats()["button"].roi_hits == 1
+
+    # Wrong region, without fallback the template is missed
+    registry.set_roi("button", (0.8, 0.8, 1, 1))
+    matcher.fallback = False
+    assert not matcher.match(frame, "button").found
+
+    # With fallback it is found and the region grows
+    matcher.fallback = True
+    assert matcher.match(frame, "button").found
+    assert registry.rois()["button"] == (60 / 320, 40 / 240, 1, 1)
+    assert registry.stats()["button"].roi_hits == 1
+
+    registry.set_roi("button", None)
+    assert registry.roi("button") is None
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_template_matcher_match_all(tmp_path, workers):
+    frame = create_scene(tmp_path, ["a", "b", "c"])
+    frame[:, 200:] = 0
+    matcher = TemplateMatcher(TemplateRegistry(str(tmp_path)), workers=workers)
+    try:
+        matches = matcher.match_all(frame, ["c", "a", "b"])
+        assert list(matches) == ["c", "a", "b"]
+        assert [match.found for match in matches.values()] == [False, True, True]
+        assert matches["b"].location == (170, 60)
+        assert matcher.match_all(frame, []) == {}
+    finally:
+        matcher.close()
+
+
+def create_smooth_scene(tmp_path):
+    rng = np.random.default_rng(1)
+    frame = cv2.GaussianBlur(rng.integers(0, 256, (480, 640, 3), np.uint8), (9, 9), 3)
+    cv2.imwrite(str(tmp_path / "button.png"), frame[200:264, 300:396])
+    return frame
+
+
+@pytest.mark.parametrize("pyramid_levels", [1, 2, 5])
+def test_template_matcher_pyramid(tmp_path, pyramid_levels):
+    frame = create_smooth_scene(tmp_path)
+    registry = TemplateRegistry(str(tmp_path))
+    matcher = TemplateMatcher(registry, learn_roi=False, pyramid_levels=pyramid_levels)
+    found, location, score = matcher.match(frame, "button")
+    assert found and location == (348, 232) and score > 0.99
+
+    # A small frame has fewer coarse levels
+    found, location, _ = matcher.match(frame[190:274, 290:406], "button")
+    assert found and location == (58, 42)
+
+
+def test_template_matcher_scales(tmp_path):
+    frame = cv2.resize(
+        create_smooth_scene(tmp_path),
+        None,
+        fx=0.75,
+        fy=0.75,
+        interpolation=cv2.INTER_AREA,
+    )
+    registry = TemplateRegistry(str(tmp_path))
+    matcher = TemplateMatcher(registry, pyramid_levels=2, scales=(0.5, 0.75, 1))
+    found, (x, y), _ = matcher.match(frame, "button")
+    assert found and abs(x - 261) <= 1 and abs(y - 174) <= 1
+    assert registry.stats()["button"].last_scale == 0.75
+
+    # The learned region fits the resized template
+    left, top, right, bottom = registry.roi("button")
+    assert abs((right - left) * 480 - 72) <= 1 and abs((bottom - top) * 360 - 48) <= 1
+
+
+def test_template_matcher_frame_cache(tmp_path):
+    frame = create_scene(tmp_path, ["a", "b"])
+    registry = TemplateRegistry(str(tmp_path))
+    matcher = TemplateMatcher(registry, workers=1)
+
+    first = matcher.match(frame, "a", frame_id=1)
+    assert matcher.match(frame, "a", frame_id=1) is first
+    matches = matcher.match_all(frame, ["a", "b"], frame_id=1)
+    assert matches["a"] is first
+    assert registry.stats()["a"].matches == 1
+    # Pyramid and a computed once and reused twice, b computed once
+    assert (matcher.cache_hits, matcher.cache_misses) == (4, 3)
+
+    # New frame
+    assert not matcher.match(np.zeros_like(frame), "a", frame_id=2).found
+    assert registry.stats()["a"].matches == 2
+
+    # No frame id, no cache
+    matcher.match(frame, "a")
+    assert registry.stats()["a"].matches == 3
+
+
+def test_template_matcher_frame_cache_recent(tmp_path):
+    frame = create_scene(tmp_path)
+    registry = TemplateRegistry(str(tmp_path))
+    matcher = TemplateMatcher(registry, cache_frames=2)
+
+    # Detectors on different frames keep each other's results
+    first = matcher.match(frame, "button", frame_id=1)
+    second = matcher.match(frame, "button", frame_id=2)
+    assert matcher.match(frame, "button", frame_id=1) is first
+    assert matcher.match(frame, "button", frame_id=2) is second
+    assert registry.stats()["button"].matches == 2
+
+    # The oldest frame is dropped for a newer one
+    matcher.match(frame, "button", frame_id=3)
+    assert registry.stats()["button"].matches == 3
+    assert matcher.match(frame, "button", frame_id=2) is second
+
+    # An older frame is computed but does not evict newer ones
+    assert matcher.match(frame, "button", frame_id=1) is not first
+    assert registry.stats()["button"].matches == 4
+    assert matcher.match(frame, "button", frame_id=2) is second
+    matcher.match(frame, "button", frame_id=3)
+    assert registry.stats()["button"].matches == 4
+
+
+def test_template_matcher_frame_cache_threads(tmp_path):
+    frame = create_scene(tmp_path)
+    registry = TemplateRegistry(str(tmp_path))
+    matcher = TemplateMatcher(registry)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def detector():
+        barrier.wait()
+        results.append(matcher.match(frame, "button", frame_id=1))
+
+    threads = [threading.Thread(target=detector) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 8 and all(result is results[0] for result in results)
+    assert registry.stats()["button"].matches == 1